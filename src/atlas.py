@@ -0,0 +1,54 @@
+# atlas.py
+# packs item images into a few large texture atlases
+
+import numpy as np
+
+# packs rectangles (width, height) into atlases of at most max_size x max_size
+# first-fit on shelves, tallest rectangles first; padding separates neighbours
+# returns a placement (atlas index, x, y) per rectangle (None if too large to fit),
+# and the size (width, height) of each atlas
+def pack(sizes, max_size, padding=2):
+  order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0], i))
+  placements = [None] * len(sizes)
+  atlases = [] # per atlas: shelves, each [top, height, used width]
+  for i in order:
+    width, height = sizes[i]
+    if width > max_size or height > max_size:
+      continue
+    for a, shelves in enumerate(atlases):
+      # fit on an existing shelf
+      for shelf in shelves:
+        if height <= shelf[1] and shelf[2] + width <= max_size:
+          placements[i] = (a, shelf[2], shelf[0])
+          shelf[2] += width + padding
+          break
+      if placements[i] is not None:
+        break
+      # otherwise, start a new shelf
+      top = shelves[-1][0] + shelves[-1][1] + padding
+      if top + height <= max_size:
+        shelves.append([top, height, width + padding])
+        placements[i] = (a, 0, top)
+        break
+    if placements[i] is None:
+      # otherwise, start a new atlas
+      atlases.append([[0, height, width + padding]])
+      placements[i] = (len(atlases) - 1, 0, 0)
+
+  # trim atlases to their contents
+  atlas_sizes = [[0, 0] for _ in atlases]
+  for size, placement in zip(sizes, placements):
+    if placement is not None:
+      atlas_size = atlas_sizes[placement[0]]
+      atlas_size[0] = max(atlas_size[0], placement[1] + size[0])
+      atlas_size[1] = max(atlas_size[1], placement[2] + size[1])
+  return placements, [tuple(s) for s in atlas_sizes]
+
+# draws (BGRA) images into atlases, given their placements (see pack)
+def render(images, placements, atlas_sizes):
+  atlases = [np.zeros((height, width, 4), np.uint8) for width, height in atlas_sizes]
+  for image, placement in zip(images, placements):
+    if placement is not None:
+      a, x, y = placement
+      atlases[a][y:y+image.shape[0], x:x+image.shape[1]] = image
+  return atlases
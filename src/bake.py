@@ -0,0 +1,67 @@
+# bake.py
+# composites (non-interactive) layers into tiles of a single background,
+# so they're drawn with a few large textures instead of a node per item
+
+import cv2
+import instrument
+import lod
+import numpy as np
+import os
+
+# reads a layer as BGRA (layers without alpha are opaque)
+def _read_layer(layer_file):
+  with instrument.stage('imread'):
+    image = cv2.imread(layer_file, cv2.IMREAD_UNCHANGED)
+  if image is None:
+    raise Exception('Failed to read ' + str(layer_file) + '. Does it exist?')
+  instrument.count('bytes_read', os.path.getsize(layer_file))
+  if image.ndim == 2:
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+  elif image.shape[2] == 3:
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+  return image
+
+# draws src over dst (both BGRA, of the same shape); returns the result
+def _composite(dst, src):
+  src_alpha = src[:, :, 3:].astype(np.float32) / 255
+  dst_alpha = dst[:, :, 3:].astype(np.float32) / 255
+  out_alpha = src_alpha + dst_alpha * (1 - src_alpha)
+  out_color = src[:, :, :3] * src_alpha + dst[:, :, :3] * dst_alpha * (1 - src_alpha)
+  out_color = np.divide(out_color, out_alpha, out=np.zeros_like(out_color), where=out_alpha > 0)
+  return np.dstack([np.rint(out_color), np.rint(out_alpha * 255)]).astype(np.uint8)
+
+# composites layer_files (in order, the first at the back), and cuts the result into
+# tiles of at most tile_size pixels
+# if scale is given (other than 1), layers are resized by scale first (see lod.scale_image)
+# layers are read (and composited) one at a time, into tiles of the result, so baking costs
+# the memory of about two layers, however many there are
+# yields (x, y, tile) for each tile with any visible pixel, row by row
+def bake(layer_files, tile_size=1024, scale=1):
+  tiles = {} # (x, y) -> tile (of tile_size, cropped once the size of the result is known)
+  height = width = 0
+  for layer_file in layer_files:
+    layer = _read_layer(layer_file)
+    if scale != 1:
+      with instrument.stage('scale'):
+        layer = lod.scale_image(layer, scale)
+    height = max(height, layer.shape[0])
+    width = max(width, layer.shape[1])
+    with instrument.stage('bake'):
+      for y in range(0, layer.shape[0], tile_size):
+        for x in range(0, layer.shape[1], tile_size):
+          src = layer[y:y + tile_size, x:x + tile_size]
+          if not src[:, :, 3].any():
+            continue
+          padded = np.zeros((tile_size, tile_size, 4), np.uint8)
+          padded[:src.shape[0], :src.shape[1]] = src
+          # the backmost visible layer is used as is
+          tiles[(x, y)] = padded if (x, y) not in tiles else _composite(tiles[(x, y)], padded)
+    del layer
+  for y in range(0, height, tile_size):
+    for x in range(0, width, tile_size):
+      tile = tiles.pop((x, y), None)
+      if tile is None:
+        instrument.count('empty_tiles')
+        continue
+      instrument.count('tiles')
+      yield x, y, tile[:min(tile_size, height - y), :min(tile_size, width - x)]
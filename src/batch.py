@@ -0,0 +1,100 @@
+# batch.py
+# builds many levels in one run (see makegame.create_level), from a JSON file listing them
+# layers of all levels are subdivided on one worker pool, and levels share one output
+# directory, where identical assets (across all levels) are written once
+
+import argparse
+from collections import Counter
+import instrument
+from itertools import count
+import json
+import makegame
+import os
+
+# reads a batch file: {"levels": [{"name", "passthrough", "deconstruct", "manifest"}]}
+# name is the level's scene file (default: level_<index>.tscn); the rest are lists of paths,
+# as in makegame's -p, -d and -m, relative to the batch file
+def read_levels(batch_path):
+  with open(batch_path, 'r') as batch_file:
+    batch = json.load(batch_file)
+  batch_dir = os.path.dirname(os.path.abspath(batch_path))
+  levels = []
+  for i, level in enumerate(batch['levels']):
+    paths = {key: [os.path.join(batch_dir, p) for p in level.get(key, [])] for key in ['passthrough', 'deconstruct', 'manifest']}
+    levels.append({'name':level.get('name', f'level_{i}.tscn'), **paths})
+  names = [level['name'] for level in levels]
+  if len(set(names)) != len(names):
+    raise Exception('Levels of ' + batch_path + ' must have distinct names.')
+  return levels
+
+# hands out the results of one subdivide_layers run to many levels (in order), as
+# create_level's subdivided; results are kept until every level using them has them
+class SharedLayers:
+
+  def __init__(self, results, layer_files):
+    self.results = results
+    self.uses = Counter(layer_files)
+    self.ready = {} # layer file -> (items, error)
+
+  def subdivided(self, layer_files):
+    for layer_file in layer_files:
+      while layer_file not in self.ready:
+        done_file, items, error = next(self.results)
+        self.ready[done_file] = (items, error)
+      items, error = self.ready[layer_file]
+      self.uses[layer_file] -= 1
+      if self.uses[layer_file] == 0:
+        del self.ready[layer_file]
+      yield layer_file, items, error
+
+  # stops subdividing (and shuts down the worker pool)
+  def close(self):
+    self.results.close()
+
+# builds levels (see read_levels) into out_dir; options are as in makegame.create_level
+# every layer (once, even if used by many levels) is queued on one pool of jobs processes
+# up front, so that the pool stays busy between levels
+# returns a report of the images the levels wrote, of each asset type (see makegame.type_report)
+def build_levels(levels, out_dir, verbose_output, **options):
+  bake_types = options.get('bake_types') or []
+  all_layers = []
+  for level in levels:
+    layer_files, layer_types = makegame.deconstruct_layers(level['deconstruct'])
+    all_layers += [f for f, (asset_type, _) in zip(layer_files, layer_types) if asset_type not in bake_types]
+  unique_layers = list(dict.fromkeys(all_layers))
+  subdivide_options = {key: options[key] for key in ['jobs', 'threads', 'cache_dir', 'cache_max_bytes', 'tile_bytes', 'atlas', 'max_collider_vertices', 'trim', 'image_format', 'compression', 'scale'] if key in options}
+  shared = SharedLayers(makegame.subdivide_level_layers(unique_layers, **subdivide_options), all_layers)
+
+  # levels share asset names and images
+  asset_ids = count()
+  written = {}
+  reported_layers = {}
+  written_files = []
+  # a layer's records may be made while building an earlier level (it's subdivided ahead),
+  # so they're reported over all levels
+  try:
+    with instrument.scope() as records:
+      for level in levels:
+        if verbose_output:
+          print('Level: ' + level['name'])
+        with instrument.stage('create_level'):
+          makegame.create_level(level['passthrough'], level['deconstruct'], out_dir, level['name'], verbose_output, manifest_files=level['manifest'], asset_ids=asset_ids, written=written, subdivided=shared.subdivided, atlas_prefix=os.path.splitext(level['name'])[0] + '_', reported_layers=reported_layers, written_files=written_files, **options)
+  finally:
+    shared.close()
+  return makegame.type_report(written_files, reported_layers, records)
+
+# command line interface; builds the levels of a batch file (argv defaults to the command line)
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Constructs godot scenes of many levels, sharing workers and assets')
+  parser.add_argument('batch', metavar='<batch file>', type=str, help='JSON file listing the levels to build')
+  makegame.add_build_arguments(parser)
+  args = parser.parse_args(argv)
+  options = makegame.build_options(parser, args)
+  report = build_levels(read_levels(args.batch), args.output, args.verbose, **options)
+  if args.verbose:
+    makegame.print_type_report(report)
+  if args.profile is not None:
+    instrument.write_report(args.profile, asset_types=report)
+
+if __name__ == '__main__':
+  main()
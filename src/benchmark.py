@@ -0,0 +1,176 @@
+# benchmark.py
+# times each stage of the pipeline on synthetic drawn layers
+# results are reported as JSON, to compare between versions
+
+import argparse
+import check
+import cv2
+import json
+import makegame
+import numpy as np
+import os
+import platform
+from scene import Scene
+import scn
+import segment
+from shutil import rmtree
+from static import Static
+import subdivide
+import subprocess
+import sys
+import tempfile
+import time
+
+# draws a synthetic layer (BGRA) of size x size pixels, with n_blobs drawn items
+# items are rotated ellipses, rectangles and polygons, with varying transparency;
+# some have (nested) holes
+def synthetic_layer(size, n_blobs, seed=0):
+  rng = np.random.default_rng(seed)
+  layer = np.zeros((size, size, 4), np.uint8)
+  max_radius = max(8, int(size / np.sqrt(n_blobs) / 3))
+  for _ in range(n_blobs):
+    center = rng.integers(max_radius, size - max_radius, 2)
+    radius = rng.integers(max_radius // 3, max_radius, 2)
+    angle = float(rng.uniform(0, 180))
+    color = tuple(int(c) for c in rng.integers(0, 160, 3)) + (int(rng.integers(128, 256)),)
+    shape = rng.integers(0, 3)
+    if shape == 0:
+      cv2.ellipse(layer, tuple(int(c) for c in center), tuple(int(r) for r in radius), angle, 0, 360, color, -1)
+    elif shape == 1:
+      box = cv2.boxPoints(((float(center[0]), float(center[1])), (float(2 * radius[0]), float(2 * radius[1])), angle))
+      cv2.fillPoly(layer, [box.astype(np.int32)], color)
+    else:
+      angles = np.sort(rng.uniform(0, 2 * np.pi, int(rng.integers(5, 12))))
+      lengths = rng.uniform(0.5, 1, len(angles)) * radius.min()
+      points = np.stack([center[0] + lengths * np.cos(angles), center[1] + lengths * np.sin(angles)], axis=1)
+      cv2.fillPoly(layer, [points.astype(np.int32)], color)
+    # cut a hole, sometimes with an island inside
+    if rng.random() < 0.3:
+      hole = max(2, int(radius.min() // 3))
+      cv2.circle(layer, tuple(int(c) for c in center), hole, (0, 0, 0, 0), -1)
+      if hole > 6 and rng.random() < 0.5:
+        cv2.circle(layer, tuple(int(c) for c in center), hole // 3, color, -1)
+  return layer
+
+# times func over repeat runs; returns seconds per run, and the last result
+def _time(func, repeat):
+  seconds = []
+  result = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = func()
+    seconds.append(time.perf_counter() - start)
+  return seconds, result
+
+def _record(stage, seconds, **info):
+  record = {'stage':stage, 'seconds':seconds, 'min':min(seconds), 'median':float(np.median(seconds))}
+  record.update(info)
+  return record
+
+# times startup of the command line (a fresh interpreter each run), for paths that
+# shouldn't load cv2/numpy: help, and a passthrough-only level
+def _startup(work_dir, repeat):
+  cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+  layer_path = os.path.join(work_dir, 'passthrough.png')
+  cv2.imwrite(layer_path, synthetic_layer(256, 4))
+  out_dir = os.path.join(work_dir, 'out_passthrough')
+  os.mkdir(out_dir)
+  commands = {'help':['--help'],
+              'makegame_help':['makegame', '--help'],
+              'makegame_passthrough':['makegame', '-p', layer_path, '-o', out_dir]
+             }
+  records = []
+  for name, args in commands.items():
+    run_command = lambda: subprocess.run([sys.executable, cli_path] + args, check=True, stdout=subprocess.DEVNULL)
+    seconds, _ = _time(run_command, repeat)
+    records.append(_record('startup', seconds, command=name))
+  return records
+
+# runs all benchmarks in work_dir; returns results (JSON-serializable)
+def run(sizes, blobs_per_mpx, repeat, scene_nodes, work_dir):
+  results = {'python':platform.python_version(),
+             'numpy':np.__version__,
+             'opencv':cv2.__version__,
+             'machine':platform.machine(),
+             'cpus':os.cpu_count(),
+             'benchmarks':[]
+            }
+  benchmarks = results['benchmarks']
+  err_px = Static.MAX_SEGMENT_ERR_PX
+  benchmarks += _startup(work_dir, repeat)
+
+  for size in sizes:
+    n_blobs = max(1, int(blobs_per_mpx * size * size / 1e6))
+    layer_path = os.path.join(work_dir, f'static_{size}.png')
+    cv2.imwrite(layer_path, synthetic_layer(size, n_blobs, seed=size))
+    info = {'size':size, 'blobs':n_blobs, 'layer_bytes':os.path.getsize(layer_path)}
+
+    seconds, items = _time(lambda: subdivide.subdivide(layer_path, error_max_px=err_px, encode=True), repeat)
+    info['items'] = len(items)
+    benchmarks.append(_record('subdivide', seconds, **info))
+
+    seconds, _ = _time(lambda: segment.segment(layer_path, err_px), repeat)
+    benchmarks.append(_record('segment', seconds, **info))
+
+    def add_types():
+      scene = Scene()
+      for i, item in enumerate(items):
+        scene.add_type(f'asset_{i}', 'static', f'images/static/asset_{i}.png', item=item)
+      return scene
+    seconds, scene = _time(add_types, repeat)
+    benchmarks.append(_record('scene_add_type', seconds, **info))
+
+    scene_path = os.path.join(work_dir, f'level_{size}.tscn')
+    seconds, _ = _time(lambda: scene.write_scene(scene_path), repeat)
+    benchmarks.append(_record('scene_write_scene', seconds, scene_bytes=os.path.getsize(scene_path), **info))
+
+    # binary scenes: the same scene, which must read back as the text scene does
+    # parse timings are of scn.py's readers (python), not of loading in Godot
+    # (see check.py scn_round_trip for a round trip of every kind of value)
+    binary_path = os.path.join(work_dir, f'level_{size}.scn')
+    seconds, _ = _time(lambda: scene.write_scene(binary_path), repeat)
+    benchmarks.append(_record('scene_write_binary', seconds, scene_bytes=os.path.getsize(binary_path), **info))
+    seconds, text_graph = _time(lambda: scn.read_text(scene_path), repeat)
+    benchmarks.append(_record('scene_parse_text', seconds, **info))
+    seconds, binary_graph = _time(lambda: scn.read(binary_path), repeat)
+    benchmarks.append(_record('scene_parse_binary', seconds, **info))
+    if binary_graph != text_graph:
+      raise Exception('Binary scene ' + binary_path + ' differs from text scene ' + scene_path + '.')
+
+    def create_level():
+      out_dir = os.path.join(work_dir, f'out_{size}')
+      if os.path.isdir(out_dir):
+        rmtree(out_dir)
+      os.mkdir(out_dir)
+      makegame.create_level([], [layer_path], out_dir, 'level.tscn', False)
+    seconds, _ = _time(create_level, repeat)
+    benchmarks.append(_record('create_level', seconds, **info))
+
+  for n_nodes in scene_nodes:
+    seconds, peak_bytes = check.scene_scaling(n_nodes, os.path.join(work_dir, f'scaling_{n_nodes}.tscn'), repeat)
+    benchmarks.append(_record('scene_scaling', [seconds], nodes=n_nodes, peak_bytes=peak_bytes))
+  return results
+
+# command line interface; runs benchmarks (argv defaults to the command line)
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Times each pipeline stage on synthetic layers, and reports JSON')
+  parser.add_argument('-s', '--sizes', metavar='<pixels>', type=int, nargs='*', default=[1000, 2000, 4000], help='side lengths of synthetic layers')
+  parser.add_argument('-b', '--blobs', metavar='<blobs>', type=float, default=50, help='drawn items per megapixel')
+  parser.add_argument('-r', '--repeat', metavar='<runs>', type=int, default=3, help='runs of each stage')
+  parser.add_argument('--scene-nodes', metavar='<nodes>', type=int, nargs='*', default=[1000, 10000, 100000], help='node counts for scene scaling runs')
+  parser.add_argument('-o', '--output', metavar='<output file>', type=str, help='JSON output file (default: print)')
+  args = parser.parse_args(argv)
+
+  work_dir = tempfile.mkdtemp(prefix='drawing-games-bench-')
+  try:
+    results = run(args.sizes, args.blobs, args.repeat, args.scene_nodes, work_dir)
+  finally:
+    rmtree(work_dir)
+  if args.output is None:
+    print(json.dumps(results, indent=2))
+  else:
+    with open(args.output, 'w') as out_file:
+      json.dump(results, out_file, indent=2)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,96 @@
+# cache.py
+# on-disk cache of analyzed layers (see subdivide.analyze), for incremental builds
+# entries are keyed by layer content, processing parameters & analysis code
+
+import hashlib
+import lod
+import os
+import pickle
+import segment
+import subdivide
+import tempfile
+
+# modules whose code determines analysis results
+CODE_MODULES = [lod, segment, subdivide]
+
+class LayerCache:
+
+  # entries past max_bytes (in total) are evicted, least recently used first
+  def __init__(self, cache_dir, max_bytes=1024**3):
+    os.makedirs(cache_dir, exist_ok=True)
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self._code_version = None
+    self.evict()
+
+  # hashes the source of the analysis code, so edits invalidate old entries
+  def code_version(self):
+    if self._code_version is None:
+      code_hash = hashlib.sha256()
+      for module in CODE_MODULES:
+        with open(module.__file__, 'rb') as src_file:
+          code_hash.update(src_file.read())
+      self._code_version = code_hash.hexdigest()
+    return self._code_version
+
+  # gets the key of a layer file, given its processing parameters
+  def key(self, in_file, **params):
+    key_hash = hashlib.sha256(self.code_version().encode())
+    key_hash.update(repr(sorted(params.items())).encode())
+    with open(in_file, 'rb') as layer_file:
+      for chunk in iter(lambda: layer_file.read(1024 * 1024), b''):
+        key_hash.update(chunk)
+    return key_hash.hexdigest()
+
+  def _entry_path(self, key):
+    return os.path.join(self.cache_dir, key + '.pickle')
+
+  # returns cached items, or None if not cached
+  def get(self, key):
+    entry_path = self._entry_path(key)
+    try:
+      with open(entry_path, 'rb') as entry_file:
+        items = pickle.load(entry_file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+      return None
+    # mark as recently used (unless another process has evicted it since)
+    try:
+      os.utime(entry_path)
+    except FileNotFoundError:
+      pass
+    return items
+
+  # stores items, then evicts entries past the size limit
+  # each writer has its own temporary file (processes may share a cache, and store the same key)
+  def put(self, key, items):
+    entry_path = self._entry_path(key)
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+    try:
+      with os.fdopen(fd, 'wb') as entry_file:
+        pickle.dump(items, entry_file, pickle.HIGHEST_PROTOCOL)
+      os.replace(tmp_path, entry_path)
+    except BaseException:
+      os.remove(tmp_path)
+      raise
+    self.evict()
+
+  # removes least recently used entries, until under max_bytes
+  # entries removed meanwhile (by other processes sharing the cache) are skipped
+  def evict(self):
+    entries = []
+    for f in os.listdir(self.cache_dir):
+      if f.endswith('.pickle'):
+        try:
+          stat = os.stat(os.path.join(self.cache_dir, f))
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, f))
+    total_bytes = sum([e[1] for e in entries])
+    for _, size, f in sorted(entries):
+      if total_bytes <= self.max_bytes:
+        break
+      try:
+        os.remove(os.path.join(self.cache_dir, f))
+      except FileNotFoundError:
+        pass
+      total_bytes -= size
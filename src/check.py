@@ -0,0 +1,126 @@
+# check.py
+# checks of properties the pipeline relies on, which a single build doesn't show
+# each check raises an Exception if it fails; run them all (or some, by name) from the command line
+
+import argparse
+import os
+from scene import ChunkedScene, Scene
+import scn
+import tempfile
+import time
+import tracemalloc
+
+# node counts of scene scaling runs
+SCALING_NODES = [1000, 10000, 100000]
+# allowed growth of time and peak memory, over linear (time is noisier)
+SCALING_TIME_SLACK = 2
+SCALING_MEMORY_SLACK = 1.5
+
+# builds a scene of n_nodes sprites and writes it; returns (seconds, peak traced bytes)
+# time is the best of repeat untraced runs; tracing slows allocations, more so with more
+# of them alive, so peak memory is measured in a run of its own
+def scene_scaling(n_nodes, out_path, repeat=3):
+  def build():
+    scene = Scene()
+    for i in range(n_nodes):
+      scene.add_type(f'asset_{i}', 'sprite', f'images/sprite/asset_{i}.png')
+    scene.write_scene(out_path)
+  seconds = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    build()
+    seconds.append(time.perf_counter() - start)
+  tracemalloc.start()
+  build()
+  peak_bytes = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return min(seconds), peak_bytes
+
+# scenes take time and peak memory linear in their number of nodes
+def check_scene_scaling(work_dir):
+  runs = [(n_nodes, *scene_scaling(n_nodes, os.path.join(work_dir, f'scaling_{n_nodes}.tscn'))) for n_nodes in SCALING_NODES]
+  for (n0, seconds0, bytes0), (n1, seconds1, bytes1) in zip(runs, runs[1:]):
+    ratio = n1 / n0
+    if seconds1 / seconds0 > SCALING_TIME_SLACK * ratio:
+      raise Exception(f'Scene time grew {seconds1 / seconds0:.1f}x from {n0} to {n1} nodes ({seconds0:.3f}s to {seconds1:.3f}s).')
+    if bytes1 / bytes0 > SCALING_MEMORY_SLACK * ratio:
+      raise Exception(f'Scene peak memory grew {bytes1 / bytes0:.1f}x from {n0} to {n1} nodes ({bytes0} to {bytes1} bytes).')
+  return ', '.join([f'{n}: {seconds:.3f}s, {peak} bytes' for n, seconds, peak in runs])
+
+# builds a chunked level with every kind of value scn encodes specially: atlas regions
+# (AtlasTexture sub-resources), convex colliders (ConvexPolygonShape2D sub-resources),
+# chunks (instanced nodes) and a passthrough background (centered = false); writes it to out_path
+def _round_trip_level(out_path):
+  scene = ChunkedScene(100, convex_colliders=True)
+  scene.add_type('background', 'sprite', 'images/background.png')
+  metadata = {'center':{'x':40, 'y':30}, 'rotation':15, 'dimensions':{'width':20, 'height':20}}
+  scene.add_type('item_0', 'sprite', 'images/atlas_0.png', item={'metadata':metadata, 'colliders':None}, region=(0, 0, 20, 20))
+  # an L shape, which decomposes into two convex pieces
+  outline = [(0, 0), (20, 0), (20, 8), (8, 8), (8, 20), (0, 20)]
+  metadata = {'center':{'x':150.5, 'y':60}, 'rotation':0, 'dimensions':{'width':20, 'height':20}}
+  scene.add_type('item_1', 'static', 'images/atlas_0.png', item={'metadata':metadata, 'colliders':[outline]}, region=(20, 0, 20, 20))
+  scene.write_scene(out_path)
+
+# gets a binary scene graph with chunk scenes referenced as text scenes (each level's chunks
+# are in its own format), to compare with the text scene graph
+def _as_text_paths(graph):
+  def text_path(path):
+    return os.path.splitext(path)[0] + '.tscn' if path.endswith('.scn') else path
+  nodes = [{**node, 'instance':None if node['instance'] is None else text_path(node['instance'])} for node in graph['nodes']]
+  return {'ext':[(ext_type, text_path(path)) for ext_type, path in graph['ext']], 'sub':graph['sub'], 'nodes':nodes}
+
+# compares scene graphs, strictly: values must have the same types too (False == 0 in python,
+# but not in a scene)
+def _same_graph(a, b):
+  return repr(a) == repr(b)
+
+# binary scenes (see scn.py) read back as the text scenes they're written from, and
+# encoding a scene graph, then decoding it, gives the same graph
+def check_scn_round_trip(work_dir):
+  text_dir = os.path.join(work_dir, 'text')
+  binary_dir = os.path.join(work_dir, 'binary')
+  os.makedirs(text_dir)
+  os.makedirs(binary_dir)
+  _round_trip_level(os.path.join(text_dir, 'level.tscn'))
+  _round_trip_level(os.path.join(binary_dir, 'level.scn'))
+  text_paths = ['level.tscn'] + [os.path.join('chunks', 'level', f) for f in sorted(os.listdir(os.path.join(text_dir, 'chunks', 'level'))) if f.endswith('.tscn')]
+  graphs = []
+  for text_path in text_paths:
+    binary_path = os.path.splitext(text_path)[0] + '.scn'
+    text_graph = scn.read_text(os.path.join(text_dir, text_path))
+    if not _same_graph(scn.decode(scn.encode(text_graph)), text_graph):
+      raise Exception('Scene graph of ' + text_path + ' changes when encoded and decoded.')
+    if not _same_graph(_as_text_paths(scn.read(os.path.join(binary_dir, binary_path))), text_graph):
+      raise Exception('Binary scene ' + binary_path + ' differs from text scene ' + text_path + '.')
+    graphs.append(text_graph)
+  # the level has every kind of value checked
+  sub_types = set([sub_type for graph in graphs for _, sub_type, _ in graph['sub']])
+  nodes = [node for graph in graphs for node in graph['nodes']]
+  kinds = {'AtlasTexture':'AtlasTexture' in sub_types,
+           'ConvexPolygonShape2D':'ConvexPolygonShape2D' in sub_types,
+           'instance':any([node['instance'] is not None for node in nodes]),
+           'centered = false':any([('centered', False) in node['properties'] for node in nodes])
+          }
+  missing = [kind for kind, found in kinds.items() if not found]
+  if len(missing) > 0:
+    raise Exception('Round trip level has no ' + ', '.join(missing) + '.')
+  return f'{len(text_paths)} scenes, {len(nodes)} nodes'
+
+CHECKS = {'scene_scaling':check_scene_scaling,
+          'scn_round_trip':check_scn_round_trip
+         }
+
+# command line interface; runs checks (argv defaults to the command line)
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Checks properties of the pipeline (scaling, formats)')
+  parser.add_argument('checks', metavar='<check>', nargs='*', help='checks to run (default: all): ' + ', '.join(CHECKS.keys()))
+  args = parser.parse_args(argv)
+  unknown = [name for name in args.checks if name not in CHECKS]
+  if len(unknown) > 0:
+    parser.error('unknown checks: ' + ', '.join(unknown))
+  with tempfile.TemporaryDirectory(prefix='drawing-games-check-') as work_dir:
+    for name in args.checks or CHECKS.keys():
+      print(name + ': ' + CHECKS[name](work_dir))
+
+if __name__ == '__main__':
+  main()
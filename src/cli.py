@@ -0,0 +1,42 @@
+# cli.py
+# single entry point for every command: python cli.py <command> [arguments]
+# commands are only imported when run, so startup stays quick
+
+import importlib
+import sys
+
+# command -> (module, description)
+COMMANDS = {'makegame':('makegame', 'construct a godot scene from image layers'),
+            'subdivide':('subdivide', 'trim an image into independent items'),
+            'deconstruct':('deconstruct', 'subdivide each image of a directory'),
+            'segment':('segment', 'segment the contours of an image'),
+            'batch':('batch', 'construct godot scenes of many levels, sharing workers and assets'),
+            'daemon':('daemon', 'build levels on warm workers, for jobs sent over a Unix socket'),
+            'benchmark':('benchmark', 'time each pipeline stage on synthetic layers'),
+            'check':('check', 'check that scenes scale linearly, and formats round-trip')
+           }
+
+def usage():
+  lines = ['usage: cli.py <command> [arguments]', '', 'commands:']
+  lines += [f'  {command:<12} {description}' for command, (_, description) in COMMANDS.items()]
+  lines += ['', 'run "cli.py <command> --help" for the arguments of a command']
+  return '\n'.join(lines)
+
+# runs a command, given the arguments after the script name
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  if len(argv) == 0 or argv[0] in ['-h', '--help']:
+    print(usage())
+    return 0 if len(argv) > 0 else 2
+  if argv[0] not in COMMANDS:
+    print(usage(), file=sys.stderr)
+    print('\nunknown command: ' + argv[0], file=sys.stderr)
+    return 2
+  module = importlib.import_module(COMMANDS[argv[0]][0])
+  sys.argv[0] = 'cli.py ' + argv[0]
+  module.main(argv[1:])
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,275 @@
+# daemon.py
+# a local build service: builds levels (see makegame.create_level) on warm worker processes,
+# which have cv2, numpy and the pipeline already imported, so a build only costs its image work
+# jobs are sent over a Unix socket, as JSON (see JobHandler); each worker builds one job at a time
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socketserver
+import threading
+
+# fields of a job (see JobHandler) -> their types (see _is_type); output is required
+JOB_FIELDS = {'passthrough':'strings', 'deconstruct':'strings', 'manifest':'strings', 'output':str, 'name':str}
+# options of a job (as in makegame.build_options; each optional) -> their types
+JOB_OPTIONS = {'threads':int,
+               'cache_dir':(str, None),
+               'cache_max_bytes':int,
+               'tile_bytes':(int, None),
+               'atlas':(str, None),
+               'atlas_max_size':int,
+               'convex_colliders':bool,
+               'max_collider_vertices':(int, None),
+               'trim':bool,
+               'image_format':str,
+               'compression':(int, None),
+               'chunk_size':(int, None),
+               'bake_types':('strings', None),
+               'bake_tile_size':int,
+               'scale':float
+              }
+# modules a build needs, imported by each worker as it starts (rather than on its first job)
+WARM_MODULES = ['cv2', 'numpy', 'tqdm', 'bake', 'deconstruct', 'makegame', 'scn', 'static', 'subdivide']
+# stages reported as progress, as they finish (a layer subdivided, the scene written)
+PROGRESS_STAGES = ['subdivide', 'write_scene']
+
+_progress = None # worker processes: queue of (job id, event) back to the server
+
+# sets up a worker process: imports everything a build needs, up front
+def _init_worker(progress):
+  global _progress
+  _progress = progress
+  for module in WARM_MODULES:
+    importlib.import_module(module)
+
+# a task for each worker, to start them all
+def _warm(_):
+  return os.getpid()
+
+# builds a job in a worker process; returns the scene path, and records of the build
+# progress is sent (to the server) as it happens, then None, once the job's finished
+def _build(job_id, job):
+  import instrument
+  import makegame
+  def hook(kind, name, value, layer):
+    if kind == 'stage' and name in PROGRESS_STAGES:
+      _progress.put((job_id, {'event':'progress', 'stage':name, 'layer':layer, 'seconds':value}))
+  # a worker builds one job at a time, so records are only of this job
+  instrument.reset()
+  instrument.add_hook(hook)
+  _progress.put((job_id, {'event':'started', 'pid':os.getpid()}))
+  try:
+    options = {key: job[key] for key in JOB_OPTIONS if key in job}
+    with instrument.stage('create_level'):
+      asset_types = makegame.create_level(job.get('passthrough', []), job.get('deconstruct', []), job['output'], job.get('name', 'level.tscn'), False, manifest_files=job.get('manifest', []), **options)
+  finally:
+    instrument.remove_hook(hook)
+    _progress.put((job_id, None))
+  return os.path.join(job['output'], job.get('name', 'level.tscn')), {**instrument.report(), 'asset_types':asset_types}
+
+# checks a (JSON) value is of a type: str, bool, int, float (or int), 'strings' (a list of
+# str), None, or a tuple of these
+def _is_type(value, value_type):
+  if isinstance(value_type, tuple):
+    return any([_is_type(value, t) for t in value_type])
+  if value_type is None:
+    return value is None
+  if value_type == 'strings':
+    return isinstance(value, list) and all([isinstance(v, str) for v in value])
+  if isinstance(value, bool):
+    return value_type is bool
+  if value_type is float:
+    return isinstance(value, (int, float))
+  return isinstance(value, value_type)
+
+# gets the name of a type (see _is_type), for errors
+def _type_name(value_type):
+  if isinstance(value_type, tuple):
+    return ' or '.join([_type_name(t) for t in value_type])
+  if value_type is None:
+    return 'null'
+  if value_type == 'strings':
+    return 'list of strings'
+  return {str:'string', bool:'boolean', int:'integer', float:'number'}[value_type]
+
+# a pool of concurrency warm workers, and the jobs they're building
+# if a worker dies, its jobs fail, and the pool is replaced (see _replace_pool)
+class BuildService:
+
+  def __init__(self, concurrency=1):
+    self.concurrency = concurrency
+    self.job_ids = itertools.count()
+    self.jobs = {} # job id -> queue of its events
+    self.lock = threading.Lock()
+    self.pool, self.progress = self._start_pool()
+
+  # starts a pool of warm workers, with its own progress queue (a worker that dies while
+  # sending progress can leave the queue unusable), and a thread forwarding that progress
+  def _start_pool(self):
+    progress = multiprocessing.Queue()
+    pool = ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_worker, initargs=(progress,))
+    # start every worker now, rather than on its first job
+    list(pool.map(_warm, range(self.concurrency)))
+    threading.Thread(target=self._forward_progress, args=(progress,), daemon=True).start()
+    return pool, progress
+
+  # replaces broken_pool (once a worker of it died) with a new pool, unless another job
+  # already has; returns the current pool
+  def _replace_pool(self, broken_pool):
+    with self.lock:
+      if self.pool is broken_pool:
+        broken_progress = self.progress
+        self.pool, self.progress = self._start_pool()
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+        # stop forwarding the broken pool's progress
+        broken_progress.put(None)
+      return self.pool
+
+  # forwards progress from workers to the queue of each job, until None
+  def _forward_progress(self, progress):
+    while True:
+      message = progress.get()
+      if message is None:
+        return
+      job_id, event = message
+      with self.lock:
+        events = self.jobs.get(job_id)
+      if events is not None:
+        events.put(event)
+
+  # builds a job (see handle_job); yields its events, as they happen
+  def build(self, job):
+    missing = [key for key in ['output'] if key not in job]
+    unknown = [key for key in job if key not in JOB_FIELDS and key not in JOB_OPTIONS]
+    if len(missing) > 0 or len(unknown) > 0:
+      yield {'event':'error', 'message':'Missing ' + str(missing) + ' or unknown ' + str(unknown) + ' job fields.'}
+      return
+    field_types = {**JOB_FIELDS, **JOB_OPTIONS}
+    invalid = [key + ' (expected ' + _type_name(field_types[key]) + ')' for key in job if not _is_type(job[key], field_types[key])]
+    if len(invalid) > 0:
+      yield {'event':'error', 'message':'Invalid job fields: ' + ', '.join(invalid) + '.'}
+      return
+    job_id = next(self.job_ids)
+    events = queue.Queue()
+    with self.lock:
+      self.jobs[job_id] = events
+      pool = self.pool
+    try:
+      try:
+        future = pool.submit(_build, job_id, job)
+      except BrokenProcessPool:
+        # a worker (of another job) died since; build on a new pool
+        pool = self._replace_pool(pool)
+        future = pool.submit(_build, job_id, job)
+      yield {'event':'queued', 'job':job_id}
+      # a worker that dies can't say it's finished
+      future.add_done_callback(lambda f: events.put(None) if isinstance(f.exception(), BrokenProcessPool) else None)
+      while True:
+        event = events.get()
+        if event is None:
+          break
+        yield event
+      try:
+        scene_path, report = future.result()
+      except BrokenProcessPool:
+        self._replace_pool(pool)
+        yield {'event':'error', 'message':'A worker died (building this job, or one before it), so the job was lost; the daemon has started new workers.'}
+        return
+      except Exception as e:
+        yield {'event':'error', 'message':str(e)}
+        return
+      yield {'event':'done', 'scene':scene_path, 'report':report}
+    finally:
+      with self.lock:
+        del self.jobs[job_id]
+
+  def shutdown(self):
+    with self.lock:
+      pool = self.pool
+    pool.shutdown(cancel_futures=True)
+
+# handles a connection: reads one job (a JSON object, on one line), and writes its events
+# (JSON objects, one per line) until the job is done
+# a job has deconstruct, passthrough and manifest (lists of paths, as in makegame's -d, -p
+# and -m), output (directory), name (scene file, default level.tscn), and options (see JOB_OPTIONS)
+# relative paths are relative to the daemon's working directory
+# events are:
+  # {"event": "queued", "job": id}
+  # {"event": "started", "pid": worker process}, once a worker is free
+  # {"event": "progress", "stage", "layer", "seconds"}, as each of PROGRESS_STAGES finishes
+  # {"event": "done", "scene": path, "report": per-stage timings and counters (see instrument.report)}
+  # {"event": "error", "message"}
+class JobHandler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    try:
+      job = json.loads(self.rfile.readline())
+    except ValueError as e:
+      events = [{'event':'error', 'message':'Invalid job: ' + str(e)}]
+    else:
+      if isinstance(job, dict):
+        events = self.server.service.build(job)
+      else:
+        events = [{'event':'error', 'message':'Invalid job: expected a JSON object, got ' + type(job).__name__ + '.'}]
+    for event in events:
+      self.wfile.write((json.dumps(event) + '\n').encode())
+      self.wfile.flush()
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+# stops serving (on SIGTERM), as on an interrupt
+def _terminate(signum, frame):
+  raise KeyboardInterrupt
+
+# serves jobs on a Unix socket (at socket_path), with at most concurrency jobs building at once
+# (the rest wait in order); runs until interrupted (or terminated)
+def serve(socket_path, concurrency=1):
+  if os.path.exists(socket_path):
+    os.remove(socket_path)
+  service = BuildService(concurrency)
+  signal.signal(signal.SIGTERM, _terminate)
+  with Server(socket_path, JobHandler) as server:
+    server.service = service
+    print(f'Serving on {socket_path}, with {concurrency} worker(s)')
+    try:
+      server.serve_forever()
+    finally:
+      service.shutdown()
+      os.remove(socket_path)
+
+# sends a job to a running daemon; yields its events (see JobHandler)
+def submit(socket_path, job):
+  import socket
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+    client.connect(socket_path)
+    client.sendall((json.dumps(job) + '\n').encode())
+    with client.makefile('r') as events:
+      for line in events:
+        yield json.loads(line)
+
+# command line interface; runs the daemon, or sends it a job (argv defaults to the command line)
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Builds levels on warm workers, for jobs sent over a Unix socket')
+  parser.add_argument('socket', metavar='<socket path>', type=str, help='path of the Unix socket')
+  parser.add_argument('-c', '--concurrency', metavar='<jobs>', type=int, default=1, help='number of jobs to build at once')
+  parser.add_argument('-s', '--submit', metavar='<job>', type=str, help='instead of serving, send a job (JSON) to the daemon, and print its events')
+  args = parser.parse_args(argv)
+  if args.submit is not None:
+    for event in submit(args.socket, json.loads(args.submit)):
+      print(json.dumps(event))
+    return
+  try:
+    serve(args.socket, args.concurrency)
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == '__main__':
+  main()
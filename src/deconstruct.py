@@ -3,41 +3,130 @@
 # creates a folder for each layer
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import instrument
 import os
 import subdivide
 from tqdm import tqdm
 
-def deconstruct(in_dir, out_dir, verbose_output=False):
+# gets input image files of a directory, in a stable order
+def list_layers(in_dir):
+  return sorted([f for f in os.listdir(in_dir) if f.endswith('.png')])
+
+# subdivide arguments that don't change results (and so aren't cached by)
+UNCACHED_ARGS = ['do_output', 'threads', 'tile_bytes']
+
+# subdivides in a worker process; returns items, and records to replay (see instrument.capture)
+def _subdivide_recorded(in_file, out_folder, subdivide_args):
+  with instrument.capture() as events:
+    items = subdivide.subdivide(in_file, out_folder, **subdivide_args)
+  return items, events
+
+# subdivides each input file, on a pool of jobs processes if jobs > 1
+# yields (in_file, items, error) in the order of in_files, regardless of jobs
+# error is the exception raised by a failed layer (and items is None)
+# subdivide_args (do_output, error_max_px, threads, ...) are passed to subdivide
+# if cache (a cache.LayerCache) is given, unchanged layers aren't subdivided again
+  # only layers without an output folder (pipeline mode) are cached
+def subdivide_layers(in_files, out_folders=None, jobs=1, cache=None, **subdivide_args):
+  if out_folders is None:
+    out_folders = [None] * len(in_files)
+
+  # look up cached layers
+  keys = [None] * len(in_files)
+  cached = [None] * len(in_files)
+  if cache is not None:
+    for i, in_file in enumerate(in_files):
+      if out_folders[i] is None:
+        with instrument.layer(in_file), instrument.stage('cache_lookup'):
+          cached_args = {k: v for k, v in subdivide_args.items() if k not in UNCACHED_ARGS}
+          keys[i] = cache.key(in_file, trans_thresh=subdivide.TRANS_THRESH, **cached_args)
+          cached[i] = cache.get(keys[i])
+          instrument.count('cache_misses' if cached[i] is None else 'cache_hits')
+
+  pool = None
+  if jobs > 1:
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    futures = [None if c is not None else pool.submit(_subdivide_recorded, f, o, subdivide_args) for f, o, c in zip(in_files, out_folders, cached)]
+  try:
+    for i, in_file in enumerate(in_files):
+      if cached[i] is not None:
+        yield in_file, cached[i], None
+        continue
+      try:
+        if pool is None:
+          items = subdivide.subdivide(in_file, out_folders[i], **subdivide_args)
+        else:
+          items, events = futures[i].result()
+          instrument.replay(events)
+      except Exception as e:
+        yield in_file, None, e
+        continue
+      if keys[i] is not None:
+        with instrument.layer(in_file), instrument.stage('cache_store'):
+          cache.put(keys[i], items)
+      yield in_file, items, None
+  finally:
+    if pool is not None:
+      pool.shutdown(cancel_futures=True)
+
+# returns analyzed items (see subdivide.analyze) of each layer, by layer name
+# if out_dir is None, nothing is written (pipeline mode)
+# trim, image_format, compression, scales: see subdivide.analyze (variants are saved as in subdivide.subdivide)
+def deconstruct(in_dir, out_dir=None, verbose_output=False, error_max_px=None, jobs=1, threads=1, tile_bytes=None, trim=False, image_format='png', compression=None, scales=None):
   # check directories
   if not os.path.isdir(in_dir):
     raise Exception('Input directory ' + in_dir + ' does not exist.')
-  if not os.path.isdir(out_dir):
+  if out_dir is not None and not os.path.isdir(out_dir):
     raise Exception('Output directory ' + out_dir + ' does not exist.')
   
   # get input image files
-  img_files = [f for f in os.listdir(in_dir) if f.endswith('.png')]
+  img_files = list_layers(in_dir)
+
+  # make an output folder for each image
+  out_folders = None
+  if out_dir is not None:
+    out_folders = []
+    for img in img_files:
+      curr_out_dir = os.path.join(out_dir, os.path.splitext(img)[0])
+      if not os.path.isdir(curr_out_dir):
+        os.mkdir(curr_out_dir)
+      out_folders.append(curr_out_dir)
 
   # subdivide each image
-  t = tqdm(img_files, desc='Subdividing:') #for nice output
-  for img in t:
+  layers = {}
+  in_files = [os.path.join(in_dir, img) for img in img_files]
+  results = subdivide_layers(in_files, out_folders, jobs, do_output=verbose_output, error_max_px=error_max_px, threads=threads, tile_bytes=tile_bytes, trim=trim, image_format=image_format, compression=compression, scales=scales)
+  t = tqdm(zip(img_files, results), total=len(img_files), desc='Subdividing:') #for nice output
+  for img, (in_file, items, error) in t:
     # update description
     t.set_description('Subdividing: ' + img)
     t.refresh()
 
-    name = os.path.splitext(img)[0]
-    curr_out_dir = os.path.join(out_dir, name)
-    if not os.path.isdir(curr_out_dir):
-      os.mkdir(curr_out_dir)
-    try:
-      subdivide.subdivide(os.path.join(in_dir, img), curr_out_dir, verbose_output)
-    except:
+    if error is not None:
       if verbose_output:
-        print('Failed to subdivide ' + img + '. Run "python subdivide.py -o' + os.path.join(in_dir, img) + curr_out_dir + '" for more verbose output.')
+        print('Failed to subdivide ' + img + '. Run "python subdivide.py -o ' + in_file + ' <output folder>" for more verbose output.')
+      continue
+    layers[os.path.splitext(img)[0]] = items
+  return layers
 
-if __name__ == '__main__':
+# command line interface; deconstructs a directory of layers (argv defaults to the command line)
+def main(argv=None):
   parser = argparse.ArgumentParser(description='Deconstructs folders of images into their constituent items.')
   parser.add_argument('input_dir', metavar='<input directory>', type=str, help='directory containing input images')
   parser.add_argument('output_dir', metavar='<output directory>', type=str, help='destination directory for output')
   parser.add_argument('-v', '--verbose', default=False, action='store_true', help='do verbose output logging')
-  args = parser.parse_args()
-  deconstruct(args.input_dir, args.output_dir, args.verbose)
\ No newline at end of file
+  parser.add_argument('-j', '--jobs', default=1, type=int, help='number of layers to subdivide in parallel')
+  parser.add_argument('-t', '--threads', default=1, type=int, help='number of items (per layer) to crop and save in parallel')
+  parser.add_argument('--tile-mb', default=None, type=int, help='process layers in strips, using at most this much memory (in MB) per strip')
+  parser.add_argument('-e', '--collider-error', default=None, type=float, help='also find item colliders (saved in the manifests), with this maximum error (in px)')
+  parser.add_argument('-f', '--format', default='png', choices=subdivide.IMAGE_FORMATS, help='image format of items')
+  parser.add_argument('--compression', default=None, type=int, choices=range(10), metavar='0-9', help='PNG compression level (0 is fastest, 9 is smallest)')
+  parser.add_argument('--trim', default=False, action='store_true', help='trim fully transparent margins from items')
+  parser.add_argument('-s', '--scales', default=None, type=float, nargs='*', metavar='<factor>', help='also save variants of items, downscaled by these factors (e.g. 0.5)')
+  args = parser.parse_args(argv)
+  tile_bytes = None if args.tile_mb is None else args.tile_mb * 1024**2
+  deconstruct(args.input_dir, args.output_dir, args.verbose, error_max_px=args.collider_error, jobs=args.jobs, threads=args.threads, tile_bytes=tile_bytes, trim=args.trim, image_format=args.format, compression=args.compression, scales=args.scales)
+
+if __name__ == '__main__':
+  main()
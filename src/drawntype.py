@@ -1,4 +1,6 @@
 
+import importlib
+
 # stores a "type", which defines a collection of godot nodes
 # types ought to be self-contained, and construct all of their own:
     # external resources
@@ -7,13 +9,22 @@ class DrawnType:
 
   # initializes a type. all setup logic must be done in this step
   # end_(ext,sub)_id ought to accurately reflect the id's used
-  def __init__(self, name, start_ext_id, start_sub_id, node_type='Node2D', parent='.'):
+  # textures (path -> ext id) may be shared between types, to declare each texture once
+  def __init__(self, name, start_ext_id, start_sub_id, node_type='Node2D', parent='.', textures=None):
     self.name = name
     self.node_type = node_type
     self.parent = parent
+    self.textures = textures
     self._curr_ext_id=start_ext_id
     self._curr_sub_id=start_sub_id
 
+  # creates a type for an asset of a layer (see Scene.add_type)
+  # options are those registered with the layer name, and those of the scene; each
+  # type uses the ones it knows
+  @classmethod
+  def create(cls, name, start_ext_id, start_sub_id, res_image_path=None, full_image_path=None, item=None, textures=None, region=None, **options):
+    return cls(name, start_ext_id, start_sub_id, textures=textures)
+
   def _get_ext_id_safe(self):
     use_id = self._curr_ext_id
     self._curr_ext_id += 1
@@ -24,6 +35,33 @@ class DrawnType:
     self._curr_sub_id += 1
     return use_id
 
+  # gets a reference to a texture (for a texture property), with the
+  # ext_resource and sub_resource strings declaring it
+  # region (x, y, width, height) uses part of the image, through an AtlasTexture
+  # strings are empty if the texture was already declared (in textures)
+  def _texture_resource(self, path, region=None):
+    ext_string = ''
+    if self.textures is not None and path in self.textures:
+      ext_id = self.textures[path]
+    else:
+      ext_id = self._get_ext_id_safe()
+      ext_string = self._ext_resource_string(path, 'Texture', ext_id)
+      if self.textures is not None:
+        self.textures[path] = ext_id
+    if region is None:
+      return f'ExtResource( {ext_id} )', ext_string, ''
+
+    region_key = (path, tuple(region))
+    if self.textures is not None and region_key in self.textures:
+      return f'SubResource( {self.textures[region_key]} )', ext_string, ''
+    sub_id = self._get_sub_id_safe()
+    sub_string = self._sub_resource_string('AtlasTexture', sub_id)
+    sub_string += f'atlas = ExtResource( {ext_id} )\n'
+    sub_string += f'region = Rect2( {", ".join([str(el) for el in region])} )\n\n'
+    if self.textures is not None:
+      self.textures[region_key] = sub_id
+    return f'SubResource( {sub_id} )', ext_string, sub_string
+
   def get_last_ext_id(self):
     return self._curr_ext_id
   
@@ -56,3 +94,38 @@ class DrawnType:
   @staticmethod
   def _sub_resource_string(sub_type, sub_id):
     return f'[sub_resource type="{sub_type}" id={sub_id}]\n'
+
+  # gets item metadata, from an analyzed item (see subdivide.analyze, manifest.read)
+  @staticmethod
+  def _load_metadata(item=None):
+    if item is not None:
+      return item['metadata']
+    return None
+
+
+# registry of types, by layer name: layer name -> (module, class name, options)
+# modules are only imported when a layer of theirs is first used, so that
+# heavy dependencies (cv2, numpy) aren't loaded unless they're needed
+_registry = {}
+
+# registers a DrawnType subclass (class_name, in module_name) for each of layer_names
+# options are passed to its create method
+def register(layer_names, module_name, class_name, **options):
+  for layer_name in layer_names:
+    _registry[layer_name] = (module_name, class_name, options)
+
+# gets the (class, options) registered for a layer name, or None
+def get_type(layer_name):
+  if layer_name not in _registry:
+    return None
+  module_name, class_name, options = _registry[layer_name]
+  return getattr(importlib.import_module(module_name), class_name), options
+
+# gets all registered layer names
+def registered_types():
+  return list(_registry)
+
+register(['sprite'], 'sprite', 'Sprite')
+register(['static'], 'static', 'Static')
+register(['platforms'], 'static', 'Static', one_way=True)
+register(['physics', 'items'], 'physics', 'Physics')
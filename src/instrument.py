@@ -0,0 +1,123 @@
+# instrument.py
+# records wall time of each stage, and counters, across the pipeline
+# stages and counters are also attributed to the layer being processed (see layer)
+# hooks (see add_hook) receive every record, e.g. to forward to other metrics
+# records are process-wide (see report); scopes (see scope) also collect them for one task
+
+from contextlib import contextmanager
+import contextvars
+import json
+import threading
+import time
+
+_lock = threading.Lock()
+# stages: stage -> {'seconds', 'calls'}; counters: counter -> value
+# layers: layer -> {'stages', 'counters'}
+def _new_records():
+  return {'stages':{}, 'counters':{}, 'layers':{}}
+
+_records = _new_records()
+_hooks = []
+_events = None # if a list, records are also collected (see capture)
+_layer = contextvars.ContextVar('layer', default=None)
+_scopes = contextvars.ContextVar('scopes', default=()) # records of enclosing scopes
+
+def _add_stage(stages, name, seconds):
+  entry = stages.setdefault(name, {'seconds':0.0, 'calls':0})
+  entry['seconds'] += seconds
+  entry['calls'] += 1
+
+def _add_counter(counters, name, amount):
+  counters[name] = counters.get(name, 0) + amount
+
+# stores a record; kind is 'stage' (value in seconds) or 'counter'
+def _record(kind, name, value, layer):
+  add = _add_stage if kind == 'stage' else _add_counter
+  section = 'stages' if kind == 'stage' else 'counters'
+  with _lock:
+    for records in (_records,) + _scopes.get():
+      add(records[section], name, value)
+      if layer is not None:
+        layer_entry = records['layers'].setdefault(layer, {'stages':{}, 'counters':{}})
+        add(layer_entry[section], name, value)
+    if _events is not None:
+      _events.append((kind, name, value, layer))
+  for hook in list(_hooks):
+    hook(kind, name, value, layer)
+
+# times the enclosed block as a stage (seconds add up over calls, and threads)
+@contextmanager
+def stage(name):
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    _record('stage', name, time.perf_counter() - start, _layer.get())
+
+# adds to a counter
+def count(name, amount=1):
+  _record('counter', name, amount, _layer.get())
+
+# attributes enclosed records to a layer
+# threads started within should run in a copy of the context (contextvars.copy_context)
+@contextmanager
+def layer(name):
+  token = _layer.set(name)
+  try:
+    yield
+  finally:
+    _layer.reset(token)
+
+# adds a hook, called as hook(kind, name, value, layer) for every record
+# kind is 'stage' (value in seconds) or 'counter'
+def add_hook(hook):
+  _hooks.append(hook)
+
+def remove_hook(hook):
+  _hooks.remove(hook)
+
+# collects records made within, so they can be replayed in another process
+@contextmanager
+def capture():
+  global _events
+  saved = _events
+  _events = []
+  try:
+    yield _events
+  finally:
+    if saved is not None:
+      saved.extend(_events)
+    _events = saved
+
+# also collects records made within (as report does, from when it's entered) in a dict of
+# their own, so that one task's records can be told apart from earlier (or other) tasks'
+# threads started within should run in a copy of the context (as for layer); scopes may nest
+@contextmanager
+def scope():
+  records = _new_records()
+  token = _scopes.set(_scopes.get() + (records,))
+  try:
+    yield records
+  finally:
+    _scopes.reset(token)
+
+# records events collected elsewhere (see capture)
+def replay(events):
+  for kind, name, value, layer_name in events:
+    _record(kind, name, value, layer_name)
+
+# clears all records (hooks are kept)
+def reset():
+  with _lock:
+    for section in _records.values():
+      section.clear()
+
+# returns all records, as a (JSON-serializable) dict
+def report():
+  with _lock:
+    return json.loads(json.dumps(_records))
+
+# writes the report (with any extra sections) as JSON
+def write_report(out_path, **sections):
+  with open(out_path, 'w') as out_file:
+    json.dump({**report(), **sections}, out_file, indent=2)
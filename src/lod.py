@@ -0,0 +1,59 @@
+# lod.py
+# downscaled (level of detail) variants of items, for lower-end targets
+# a variant's image, position, dimensions and colliders are all scaled by its factor,
+# so a level built from variants looks like the full-size level, scaled down
+
+import os
+
+# gets the size of an image of (width, height), scaled by factor (at least a pixel)
+def scaled_size(width, height, factor):
+  return max(1, round(width * factor)), max(1, round(height * factor))
+
+# gets the name of an item's variant at factor (e.g. item_0@0.5)
+def variant_name(name, factor):
+  return f'{name}@{factor:g}'
+
+# gets the memory of an uncompressed (RGBA) texture of (width, height), in bytes
+def texture_bytes(width, height):
+  return width * height * 4
+
+# resizes an image by factor (averaging pixels, for downscaling)
+def scale_image(image, factor):
+  import cv2
+  size = scaled_size(image.shape[1], image.shape[0], factor)
+  return cv2.resize(image, size, interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR)
+
+# scales an item (see subdivide.analyze, manifest.read) by factor; returns the variant, with:
+  # image: the item's image, resized (None if the item has none)
+  # path: the variant's file, next to the item's (for items from a manifest)
+  # metadata: center and dimensions scaled (rotation is kept)
+  # colliders: scaled (and rounded)
+  # scale: factor
+  # size, full_size: (width, height) of the variant's image, and of the item's
+# the item itself isn't changed
+def scale_item(item, factor):
+  variant = dict(item)
+  variant['name'] = variant_name(item['name'], factor)
+  variant['encoded'] = None
+  variant['variants'] = {}
+  if item.get('image') is not None:
+    full_size = (item['image'].shape[1], item['image'].shape[0])
+    variant['image'] = scale_image(item['image'], factor)
+  else:
+    dimensions = item['metadata']['dimensions']
+    full_size = (dimensions['width'], dimensions['height'])
+  if item.get('path') is not None:
+    variant['path'] = os.path.join(os.path.dirname(item['path']), variant['name'] + os.path.splitext(item['path'])[1])
+  size = scaled_size(full_size[0], full_size[1], factor)
+  if item.get('metadata') is not None:
+    center = item['metadata']['center']
+    variant['metadata'] = {'center':{'x':center['x'] * factor, 'y':center['y'] * factor},
+                           'rotation':item['metadata']['rotation'],
+                           'dimensions':{'width':size[0], 'height':size[1]}
+                          }
+  if item.get('colliders') is not None:
+    variant['colliders'] = [[(round(x * factor), round(y * factor)) for x, y in points] for points in item['colliders']]
+  variant['scale'] = factor
+  variant['size'] = size
+  variant['full_size'] = full_size
+  return variant
@@ -1,34 +1,32 @@
 # makegame.py
 # constructs godot node tree from image layers
 
+# modules that need cv2/numpy (or are slow to import) are imported where they're used,
+# so that passthrough-only levels (and --help) start quickly
 import argparse
-from deconstruct import deconstruct
-from scene import Scene
-from subdivide import subdivide
-from shutil import copyfile, rmtree
+import hashlib
+import instrument
+from itertools import count, islice
+import lod
+import manifest
+from scene import ChunkedScene, Scene
+from shutil import copyfile
 import os
-from tqdm import tqdm
+import time
 
-total_assets = 0
+# types of layers whose items move or collide, and so can't be baked
+INTERACTIVE_TYPES = ['static', 'physics', 'items', 'platforms']
 
-# copies a single file to the output directory, safely
-def copy_file(out_dir, asset_path, new_name=None, subfolder=None):
+# gets the path of an asset in the output directory, creating folders as needed
+def get_asset_path(out_dir, img_name, subfolder=None):
   if not os.path.isdir(out_dir):
-    print("Output directory " + out_dir + " does not exist. Exiting...")
-    exit(1)
+    raise Exception('Output directory ' + out_dir + ' does not exist.')
 
   # confirm/create images directory
   img_dir = os.path.join(out_dir, 'images')
   if not os.path.isdir(img_dir):
     os.mkdir(img_dir)
 
-  # copy asset
-  img_name = None
-  if new_name is None:
-    img_name = os.path.basename(asset_path)
-  else:
-    img_name = new_name
-  
   img_path = None
   if subfolder is None:
     img_path = os.path.join(img_dir, img_name)
@@ -37,97 +35,614 @@ def copy_file(out_dir, asset_path, new_name=None, subfolder=None):
     if not os.path.isdir(sub_path):
       os.mkdir(sub_path)
     img_path = os.path.join(sub_path, img_name)
-  
-  copyfile(asset_path, img_path)
   return img_path
 
-def add_asset(scene, asset_path, out_dir, asset_type=None, meta_path=None):
-  global total_assets
+# copies a single file to the output directory, safely
+def copy_file(out_dir, asset_path, new_name=None, subfolder=None):
+  img_name = None
+  if new_name is None:
+    img_name = os.path.basename(asset_path)
+  else:
+    img_name = new_name
+  img_path = get_asset_path(out_dir, img_name, subfolder)
+  with instrument.stage('copy_file'):
+    copyfile(asset_path, img_path)
+  instrument.count('bytes_written', os.path.getsize(img_path))
+  return img_path
+
+# writes an analyzed item's image straight into the output directory
+# uses the already-encoded image, if subdivide encoded it
+# otherwise, encodes it in the format of new_name's extension (see subdivide.encode_image)
+def write_item(out_dir, item, new_name, subfolder=None, compression=None):
+  img_path = get_asset_path(out_dir, new_name, subfolder)
+  encoded = item.get('encoded')
+  if encoded is None:
+    from subdivide import encode_image
+    with instrument.stage('encode'):
+      encoded = encode_image(item['image'], os.path.splitext(new_name)[1][1:], compression)
+    instrument.count('bytes_encoded', len(encoded))
+  try:
+    with instrument.stage('write_file'), open(img_path, 'wb') as img_file:
+      img_file.write(encoded)
+  except:
+    raise Exception('Failed to write to ' + img_path + '.')
+  instrument.count('bytes_written', os.path.getsize(img_path))
+  return img_path
+
+# hashes an asset's pixels, to find identical assets
+def asset_hash(asset_path=None, item=None):
+  if item is None:
+    with open(asset_path, 'rb') as asset_file:
+      return hashlib.sha256(asset_file.read()).hexdigest()
+  if item.get('encoded') is not None:
+    # encoding is deterministic; identical pixels give identical bytes
+    return hashlib.sha256(item['encoded']).hexdigest()
+  image_hash = hashlib.sha256(str(item['image'].shape).encode())
+  image_hash.update(item['image'].tobytes())
+  return image_hash.hexdigest()
+
+# adds an asset from a file (asset_path), or from an analyzed item (see subdivide.analyze)
+# an item may also come with its file (see manifest.read)
+# asset_ids numbers assets (e.g. itertools.count()); everything written to out_dir shares one
+# written (hash -> path) shares one image file between identical assets
+# if region is given, asset_path is an atlas (already in out_dir), and the item uses that region
+# compression: see subdivide.encode_image (for items that aren't encoded yet)
+# the texture memory of scaled items (see lod.scale_item) is counted, with what it'd be at full size
+def add_asset(scene, asset_path, out_dir, asset_ids, asset_type=None, item=None, written=None, region=None, compression=None):
   # copy asset to out_dir; all names are safe
-  asset_basename = f'asset_{total_assets}'
-  new_asset_path = copy_file(out_dir, asset_path, asset_basename + '.png', asset_type)
+  asset_basename = f'asset_{next(asset_ids)}'
+  asset_ext = os.path.splitext(asset_path)[1] if asset_path is not None else '.' + item.get('format', 'png')
+  pixel_hash = None
+  duplicate = False
+  if written is not None and region is None:
+    with instrument.stage('hash'):
+      pixel_hash = asset_hash(asset_path) if asset_path is not None else asset_hash(item=item)
+  if region is not None:
+    new_asset_path = asset_path
+  elif pixel_hash is not None and pixel_hash in written:
+    new_asset_path = written[pixel_hash]
+    duplicate = True
+    instrument.count('duplicate_assets')
+  elif asset_path is not None:
+    new_asset_path = copy_file(out_dir, asset_path, asset_basename + asset_ext, asset_type)
+  else:
+    new_asset_path = write_item(out_dir, item, asset_basename + asset_ext, asset_type, compression)
+  if pixel_hash is not None:
+    written[pixel_hash] = new_asset_path
+  # (duplicates share a texture, so use no more memory)
+  if item is not None and item.get('full_size') is not None and not duplicate:
+    instrument.count('texture_bytes', lod.texture_bytes(*item['size']))
+    instrument.count('full_texture_bytes', lod.texture_bytes(*item['full_size']))
   # add a node to the scene (including metadata)
   # added with out_dir as root
-  scene.add_type(asset_basename, asset_type, os.path.relpath(new_asset_path, out_dir), asset_path, meta_path)
-  total_assets += 1
-
-def create_level(pass_files, dec_files, out_dir, out_file, verbose_output):
-  scene = Scene()
-
-  # handle passthrough files
-  t = tqdm(pass_files, desc='Passthrough:')
-  for pass_file in t:
-    t.set_description('Passthrough: ' + pass_file)
-    t.refresh()
-    asset_type = os.path.splitext(os.path.basename(pass_file))[0]
-    if os.path.isfile(pass_file):
-      add_asset(scene, pass_file, out_dir, asset_type)
-    elif os.path.isdir(pass_file):
-      dir_contents = [f for f in os.listdir(pass_file) if f.endswith('.png')]
-      for f in dir_contents:
-        add_asset(scene, os.path.join(pass_file, f), out_dir, asset_type)
+  scene.add_type(asset_basename, asset_type, os.path.relpath(new_asset_path, out_dir), new_asset_path, item, region)
+
+# adds a passthrough file; if scale is given (other than 1), the file is resized (as a PNG)
+def add_passthrough(scene, pass_file, out_dir, asset_ids, asset_type, written=None, scale=1, compression=None):
+  if scale == 1:
+    add_asset(scene, pass_file, out_dir, asset_ids, asset_type, written=written)
+    return
+  import cv2
+  with instrument.stage('imread'):
+    image = cv2.imread(pass_file, cv2.IMREAD_UNCHANGED)
+  if image is None:
+    raise Exception('Failed to read ' + str(pass_file) + '. Does it exist?')
+  # passthrough files have no metadata (they're placed at the origin)
+  item = {'name':os.path.basename(pass_file), 'image':image, 'format':'png', 'metadata':None, 'colliders':None}
+  with instrument.stage('scale'):
+    variant = lod.scale_item(item, scale)
+  add_asset(scene, None, out_dir, asset_ids, asset_type, item=variant, written=written, compression=compression)
+
+# packs analyzed items into atlases (all together, or per asset type), then adds them
+# identical items share a region; items too large for an atlas get their own file
+# atlases are written in image_format (see subdivide.encode_image), named by group
+# (after name_prefix, so that levels sharing out_dir don't overwrite each other's atlases)
+def add_atlas_assets(scene, typed_items, out_dir, asset_ids, group_by_type=False, max_size=4096, written=None, image_format='png', compression=None, name_prefix=''):
+  import atlas
+  # collect unique images of each atlas group
+  item_hashes = []
+  groups = {} # group -> hashes (in order of appearance)
+  images = {} # hash -> image
+  for asset_type, item in typed_items:
+    with instrument.stage('hash'):
+      pixel_hash = asset_hash(item=item)
+    item_hashes.append(pixel_hash)
+    if pixel_hash not in images:
+      images[pixel_hash] = item['image']
+      groups.setdefault(asset_type if group_by_type else 'all', []).append(pixel_hash)
+
+  # pack and write atlases of each group
+  regions = {} # hash -> (atlas path, region)
+  atlas_paths_of = {} # group -> its atlas files
+  for group, hashes in groups.items():
+    group_images = [images[h] for h in hashes]
+    with instrument.stage('atlas_pack'):
+      placements, atlas_sizes = atlas.pack([(img.shape[1], img.shape[0]) for img in group_images], max_size)
+      atlas_images = atlas.render(group_images, placements, atlas_sizes)
+    atlas_paths = atlas_paths_of[group] = []
+    for a, atlas_image in enumerate(atlas_images):
+      atlas_paths.append(write_item(out_dir, {'image':atlas_image}, f'{name_prefix}{group}_{a}.{image_format}', 'atlas', compression))
+    for pixel_hash, img, placement in zip(hashes, group_images, placements):
+      if placement is not None:
+        a, x, y = placement
+        regions[pixel_hash] = (atlas_paths[a], (x, y, img.shape[1], img.shape[0]))
+
+  # add items, in order
+  for (asset_type, item), pixel_hash in zip(typed_items, item_hashes):
+    if pixel_hash in regions:
+      atlas_path, region = regions[pixel_hash]
+      add_asset(scene, atlas_path, out_dir, asset_ids, asset_type, item=item, region=region)
+    else:
+      add_asset(scene, None, out_dir, asset_ids, asset_type, item=item, written=written, compression=compression)
+  return [path for paths in atlas_paths_of.values() for path in paths]
+
+# reports the image files (number, and bytes) among files of each asset type (the folder
+# they're in), and the time spent encoding them; layer_types maps each input (layer file, or
+# folder) to its asset type, and records are of the build (see instrument.scope)
+# for scaled levels, the memory of scaled textures (texture_bytes) is also reported,
+# with what it would be at full size (full_texture_bytes)
+def type_report(files, layer_types, records):
+  report = {}
+  for f in dict.fromkeys(files):
+    entry = report.setdefault(os.path.basename(os.path.dirname(f)), {'files':0, 'bytes':0, 'encode_seconds':0.0})
+    entry['files'] += 1
+    entry['bytes'] += os.path.getsize(f)
+  report = dict(sorted(report.items()))
+  layers = records['layers']
+  for layer_file, asset_type in layer_types.items():
+    if asset_type not in report:
+      continue
+    encode_stage = layers.get(layer_file, {}).get('stages', {}).get('encode')
+    if encode_stage is not None:
+      report[asset_type]['encode_seconds'] += encode_stage['seconds']
+    counters = layers.get(layer_file, {}).get('counters', {})
+    for counter in ['texture_bytes', 'full_texture_bytes']:
+      if counter in counters:
+        report[asset_type][counter] = report[asset_type].get(counter, 0) + counters[counter]
+  return report
+
+# prints a type report (see type_report)
+def print_type_report(report):
+  for asset_type, entry in report.items():
+    line = f'{asset_type}: {entry["files"]} files, {entry["bytes"]} bytes, encoded in {entry["encode_seconds"]:.3f}s'
+    if entry.get('full_texture_bytes'):
+      saved = 1 - entry['texture_bytes'] / entry['full_texture_bytes']
+      line += f', {entry["texture_bytes"]} of {entry["full_texture_bytes"]} bytes of textures ({saved:.0%} saved)'
+    print(line)
+
+# reports the files a level wrote (see type_report): those added to written (after its first
+# written_before), and its atlas_files; they're also added to written_files
+def _level_report(written, written_before, atlas_files, written_files, layer_types, records):
+  files = list(islice(written.values(), written_before, None)) + atlas_files
+  written_files += files
+  return type_report(files, layer_types, records)
+
+# if cache_dir is given, analyzed layers are cached there (up to cache_max_bytes)
+# if tile_bytes is given, layers are binarized in strips of at most that size
+# if atlas is 'all' or 'type', items are packed into atlases (of at most atlas_max_size),
+# for all items or per asset type
+# convex_colliders, max_collider_vertices: see Static (convex, max_vertices)
+# manifest_files are already-subdivided layers: folders with a manifest (see manifest.write),
+# or directories of them
+# trim, image_format, compression: see subdivide.analyze
+# if chunk_size is given, items are split into chunks of that many pixels (see ChunkedScene)
+# deconstruct layers of bake_types aren't subdivided, but composited into tiles of a
+# background (of at most bake_tile_size pixels; see bake.bake), added behind all items
+# levels built into the same out_dir may share asset_ids and written (see add_asset), so that
+# their assets don't clash, and identical assets are written once
+# (atlas names are then prefixed with atlas_prefix; see add_atlas_assets)
+# subdivided gives (layer_file, items, error) of layer files, in order; by default, they're
+# subdivided here (see deconstruct.subdivide_layers, and jobs, threads and cache_dir above)
+# returns a report of the images this call wrote, of each asset type, and of its records
+# (see type_report); written_files (a list) is extended with those images
+# if scale is given (other than 1), the level is built from variants of its images, downscaled
+# by scale (see lod.scale_item), with positions, dimensions and colliders to match
+  # manifest_files must then have variants at scale (see subdivide.subdivide)
+# reported_layers (input -> asset type) is filled with the inputs of the level, for type_report
+# reports are of this call only (records are scoped; see instrument.scope), so levels can be
+# built one after another, in one process
+def create_level(pass_files, dec_files, out_dir, out_file, verbose_output, jobs=1, threads=1, cache_dir=None, cache_max_bytes=1024**3, tile_bytes=None, atlas=None, atlas_max_size=4096, convex_colliders=False, max_collider_vertices=None, manifest_files=None, trim=False, image_format='png', compression=None, chunk_size=None, bake_types=None, bake_tile_size=1024, asset_ids=None, written=None, subdivided=None, atlas_prefix='', scale=1, reported_layers=None, written_files=None):
+  if asset_ids is None:
+    asset_ids = count()
+  if reported_layers is None:
+    reported_layers = {}
+  if chunk_size is None:
+    scene = Scene(convex_colliders=convex_colliders, max_collider_vertices=max_collider_vertices)
+  else:
+    scene = ChunkedScene(chunk_size, convex_colliders=convex_colliders, max_collider_vertices=max_collider_vertices)
+  # identical assets (across all layers) share one image file
+  if written is None:
+    written = {}
+  if written_files is None:
+    written_files = []
+  # written keeps its order, so files written by this call are the ones added from here on
+  written_before = len(written)
+  atlas_files = []
+  with instrument.scope() as records:
+    # handle passthrough files
+    for pass_file in pass_files:
+      if verbose_output:
+        print('Passthrough: ' + pass_file)
+      asset_type = os.path.splitext(os.path.basename(pass_file))[0]
+      reported_layers[pass_file] = asset_type
+      with instrument.layer(pass_file):
+        if os.path.isfile(pass_file):
+          add_passthrough(scene, pass_file, out_dir, asset_ids, asset_type, written, scale, compression)
+        elif os.path.isdir(pass_file):
+          dir_contents = [f for f in os.listdir(pass_file) if f.endswith('.png')]
+          for f in dir_contents:
+            add_passthrough(scene, os.path.join(pass_file, f), out_dir, asset_ids, asset_type, written, scale, compression)
+  
+    # handle subdivided layers; each item's file is named by its manifest
+    for manifest_file in manifest_files or []:
+      asset_type = os.path.basename(os.path.normpath(manifest_file))
+      if manifest.exists(manifest_file):
+        layer_dirs = [manifest_file]
+      else:
+        layer_dirs = [os.path.join(manifest_file, d) for d in sorted(os.listdir(manifest_file)) if manifest.exists(os.path.join(manifest_file, d))]
+      for layer_dir in layer_dirs:
+        if verbose_output:
+          print('Manifest: ' + layer_dir)
+        reported_layers[layer_dir] = asset_type
+        with instrument.layer(layer_dir):
+          for item in manifest.read(layer_dir, scale):
+            add_asset(scene, item['path'], out_dir, asset_ids, asset_type, item=item, written=written)
+
+    # passthrough-only levels are done (without loading cv2)
+    if len(dec_files) == 0:
+      scene.write_scene(os.path.join(out_dir, out_file))
+      return _level_report(written, written_before, atlas_files, written_files, reported_layers, records)
+
+    # handle deconstruct files
+    from tqdm import tqdm
+    layer_files, layer_types = deconstruct_layers(dec_files)
+
+    # bake layers of bake types; each tile is a sprite
+    bake_files = [f for f, (asset_type, _) in zip(layer_files, layer_types) if asset_type in (bake_types or [])]
+    if len(bake_files) > 0:
+      from bake import bake
+      reported_layers['baked'] = 'baked'
+      for x, y, tile in bake(bake_files, bake_tile_size, scale):
+        metadata = {'center':{'x':x + tile.shape[1] / 2, 'y':y + tile.shape[0] / 2},
+                    'rotation':0,
+                    'dimensions':{'width':tile.shape[1], 'height':tile.shape[0]}
+                   }
+        tile_item = {'name':f'tile_{x}_{y}', 'image':tile, 'format':image_format, 'metadata':metadata, 'colliders':None}
+        if scale != 1:
+          # layers are scaled before they're tiled; the tile's area in the full-size layers
+          tile_item.update(size=(tile.shape[1], tile.shape[0]), full_size=(round(tile.shape[1] / scale), round(tile.shape[0] / scale)))
+        with instrument.layer('baked'):
+          add_asset(scene, None, out_dir, asset_ids, 'baked', item=tile_item, written=written, compression=compression)
+      layer_types = [t for f, t in zip(layer_files, layer_types) if f not in bake_files]
+      layer_files = [f for f in layer_files if f not in bake_files]
+
+    # subdivide layers (in parallel, if jobs > 1), and add them in input order
+    # so asset names and resource ids don't depend on the number of jobs
+    # items are kept in memory (encoded by subdivide), and written once to their final location
+    # atlas items are kept decoded, and added once all are packed
+    atlas_items = []
+    if subdivided is None:
+      results = subdivide_level_layers(layer_files, jobs=jobs, threads=threads, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes, tile_bytes=tile_bytes, atlas=atlas, max_collider_vertices=max_collider_vertices, trim=trim, image_format=image_format, compression=compression, scale=scale)
+    else:
+      results = subdivided(layer_files)
+    t = tqdm(zip(layer_types, results), total=len(layer_files), desc='Deconstructing:')
+    for (asset_type, in_dir), (layer_file, items, error) in t:
+      t.set_description('Deconstructing: ' + layer_file)
+      t.refresh()
+      if error is not None:
+        # failures in directories are skipped (as in deconstruct)
+        if not in_dir:
+          raise error
+        if verbose_output:
+          print('Failed to subdivide ' + layer_file + '.')
+        continue
+      with instrument.layer(layer_file):
+        for item in items:
+          if scale != 1:
+            item = item['variants'][scale]
+          if atlas is None:
+            add_asset(scene, None, out_dir, asset_ids, asset_type, item=item, written=written, compression=compression)
+          else:
+            atlas_items.append((asset_type, item))
+    if atlas is not None:
+      atlas_files = add_atlas_assets(scene, atlas_items, out_dir, asset_ids, atlas == 'type', atlas_max_size, written, image_format, compression, atlas_prefix)
   
-  # handle deconstruct files
-  # create temp dir if not exists
-  tmp_path = os.path.join(out_dir, 'tmp')
-  if not os.path.isdir(tmp_path):
-    os.mkdir(tmp_path)
-  t = tqdm(dec_files, desc='Deconstructing:')
-  for dec_file in t:
-    t.set_description('Deconstructing: ' + dec_file)
-    t.refresh()
-    # use given name as "type;" make folder for it
+    # write scene file
+    scene.write_scene(os.path.join(out_dir, out_file))
+    reported_layers.update({layer_file: asset_type for layer_file, (asset_type, _) in zip(layer_files, layer_types)})
+    return _level_report(written, written_before, atlas_files, written_files, reported_layers, records)
+
+# gets every layer of deconstruct files; directories contribute each of their images
+# returns layer files, and their (asset type, is in a directory), in order
+def deconstruct_layers(dec_files):
+  from deconstruct import list_layers
+  layer_files = []
+  layer_types = []
+  for dec_file in dec_files:
+    # use given name as "type"
     asset_type = os.path.splitext(os.path.basename(dec_file))[0]
-    tmp_path_ext = os.path.join(tmp_path, asset_type)
-    if not os.path.isdir(tmp_path_ext):
-      os.mkdir(tmp_path_ext)
     if os.path.isfile(dec_file):
       # handle single image files
-      subdivide(dec_file, tmp_path_ext)
-      res_files = [f for f in os.listdir(tmp_path_ext)]
-      for i in range(len(res_files)):
-        if i % 2 == 0:
-          add_asset(scene, os.path.join(tmp_path_ext, res_files[i]), out_dir, asset_type, os.path.join(tmp_path_ext, res_files[i+1]))
+      layer_files.append(dec_file)
+      layer_types.append((asset_type, False))
     elif os.path.isdir(dec_file):
       # handle directories of image files
-      deconstruct(dec_file, os.path.join(tmp_path, asset_type))
-      res_dirs = [f for f in os.listdir(tmp_path_ext)]
-      for d in res_dirs:
-        d_path = os.path.join(tmp_path_ext, d)
-        res_files = [f for f in os.listdir(d_path)]
-        for i in range(len(res_files)):
-          if i % 2 == 0:
-            add_asset(scene, os.path.join(d_path, res_files[i]), out_dir, asset_type, os.path.join(d_path, res_files[i+1]))
-  
-  # write scene file
-  scene.write_scene(os.path.join(out_dir, out_file))
-  # clean up (delete /tmp)
-  rmtree(tmp_path)
+      for f in list_layers(dec_file):
+        layer_files.append(os.path.join(dec_file, f))
+        layer_types.append((asset_type, True))
+  return layer_files, layer_types
 
-if __name__ == '__main__':
+# subdivides the layers of a level (see deconstruct.subdivide_layers); options are as in create_level
+# items are encoded by subdivide, unless they're packed into atlases
+# if scale is given (other than 1), items come with variants at scale (made while cropping)
+def subdivide_level_layers(layer_files, jobs=1, threads=1, cache_dir=None, cache_max_bytes=1024**3, tile_bytes=None, atlas=None, max_collider_vertices=None, trim=False, image_format='png', compression=None, scale=1):
+  from deconstruct import subdivide_layers
+  from static import Static
+  cache = None
+  if cache_dir is not None:
+    from cache import LayerCache
+    cache = LayerCache(cache_dir, cache_max_bytes)
+  return subdivide_layers(layer_files, error_max_px=Static.MAX_SEGMENT_ERR_PX, jobs=jobs, threads=threads, encode=atlas is None, cache=cache, tile_bytes=tile_bytes, max_vertices=max_collider_vertices, trim=trim, image_format=image_format, compression=compression, scales=None if scale == 1 else [scale])
+
+# gets each watched input file, in scene order: (path, asset type, is deconstructed)
+# directories contribute each of their images (as in create_level)
+def _watched_files(pass_files, dec_files):
+  from deconstruct import list_layers
+  watched = []
+  for in_paths, deconstructed in [(pass_files, False), (dec_files, True)]:
+    for in_path in in_paths:
+      asset_type = os.path.splitext(os.path.basename(in_path))[0]
+      if os.path.isdir(in_path):
+        watched += [(os.path.join(in_path, f), asset_type, deconstructed) for f in list_layers(in_path)]
+      else:
+        watched.append((in_path, asset_type, deconstructed))
+  return watched
+
+# gets a file's (modification time, size), or None if it's missing
+def _file_signature(path):
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  return (stat.st_mtime_ns, stat.st_size)
+
+# builds a level, then rebuilds it whenever its inputs change (polling every interval seconds)
+# only changed files are processed again; each input file is a separate part of the scene
+# (with its own resources and images), so the rest keep their ids, names and images
+# identical assets are only shared within a file; atlases aren't supported
+# runs until interrupted; other arguments are as in create_level
+def watch_level(pass_files, dec_files, out_dir, out_file, verbose_output, interval=0.25, jobs=1, threads=1, cache_dir=None, cache_max_bytes=1024**3, tile_bytes=None, convex_colliders=False, max_collider_vertices=None, trim=False, image_format='png', compression=None):
+  # a resident process; import everything up front
+  from deconstruct import subdivide_layers
+  from static import Static
+  cache = None
+  if cache_dir is not None:
+    from cache import LayerCache
+    cache = LayerCache(cache_dir, cache_max_bytes)
+  out_path = os.path.join(out_dir, out_file)
+  # parts are named from one sequence, so their assets never clash
+  asset_ids = count()
+  root = Scene()
+  parts = {} # path -> (signature, scene part, written)
+  next_ids = (root.curr_ext_resource_id, root.curr_sub_resource_id)
+  while True:
+    watched = _watched_files(pass_files, dec_files)
+    signatures = {path: _file_signature(path) for path, _, _ in watched}
+    changed = [w for w in watched if signatures[w[0]] is not None and (w[0] not in parts or parts[w[0]][0] != signatures[w[0]])]
+    removed = [path for path in parts if signatures.get(path) is None]
+    if len(changed) > 0 or len(removed) > 0:
+      start = time.perf_counter()
+      # drop old parts, and their images
+      for path in removed + [path for path, _, _ in changed if path in parts]:
+        for img_path in parts.pop(path)[2].values():
+          if os.path.isfile(img_path):
+            os.remove(img_path)
+
+      # subdivide changed layers (in parallel, if jobs > 1), and add each as a new part
+      dec_paths = [path for path, _, deconstructed in changed if deconstructed]
+      results = subdivide_layers(dec_paths, error_max_px=Static.MAX_SEGMENT_ERR_PX, jobs=jobs, threads=threads, encode=True, cache=cache, tile_bytes=tile_bytes, max_vertices=max_collider_vertices, trim=trim, image_format=image_format, compression=compression)
+      results = {layer_file: (items, error) for layer_file, items, error in results}
+      for path, asset_type, deconstructed in changed:
+        part = Scene(convex_colliders=convex_colliders, max_collider_vertices=max_collider_vertices, root=False, start_ext_id=next_ids[0], start_sub_id=next_ids[1])
+        written = {}
+        # failed files (possibly still being saved) are kept empty, until they change again
+        try:
+          if deconstructed:
+            items, error = results[path]
+            if error is not None:
+              raise error
+            with instrument.layer(path):
+              for item in items:
+                add_asset(part, None, out_dir, asset_ids, asset_type, item=item, written=written)
+          else:
+            add_asset(part, path, out_dir, asset_ids, asset_type, written=written)
+        except Exception as e:
+          print('Failed to build ' + path + ': ' + str(e))
+          part = Scene(root=False, start_ext_id=next_ids[0], start_sub_id=next_ids[1])
+        parts[path] = (signatures[path], part, written)
+        next_ids = (part.curr_ext_resource_id, part.curr_sub_resource_id)
+
+      # replace the scene file at once, so it's never read half-written
+      # (keeping the extension, which sets the scene format)
+      tmp_path = '.tmp'.join(os.path.splitext(out_path))
+      Scene.write_scenes(tmp_path, [root] + [parts[path][1] for path, _, _ in watched if path in parts])
+      os.replace(tmp_path, out_path)
+      print(f'Rebuilt {len(changed)} changed, {len(removed)} removed file(s) in {time.perf_counter() - start:.2f}s')
+      if verbose_output:
+        for path, _, _ in changed:
+          print('  ' + path)
+    time.sleep(interval)
+
+# adds the arguments of building levels (output, and options of create_level) to a parser
+# shared by makegame and batch
+def add_build_arguments(parser):
+  parser.add_argument('-o', '--output',
+                      metavar='<output file>',
+                      type=str,
+                      help='directory for map file and requesite assets')
+  parser.add_argument('-v', '--verbose',
+                      default=False,
+                      action='store_true',
+                      help='do verbose output logging')
+  parser.add_argument('-j', '--jobs',
+                      metavar='<jobs>',
+                      type=int,
+                      default=1,
+                      help='number of layers to subdivide in parallel')
+  parser.add_argument('-t', '--threads',
+                      metavar='<threads>',
+                      type=int,
+                      default=1,
+                      help='number of items (per layer) to crop and encode in parallel')
+  parser.add_argument('-c', '--cache',
+                      metavar='<cache directory>',
+                      type=str,
+                      help='directory for caching subdivided layers between builds')
+  parser.add_argument('--cache-size',
+                      metavar='<megabytes>',
+                      type=int,
+                      default=1024,
+                      help='maximum size of the cache')
+  parser.add_argument('--tile-mb',
+                      metavar='<megabytes>',
+                      type=int,
+                      help='process layers in strips, using at most this much memory per strip')
+  parser.add_argument('--atlas',
+                      nargs='?',
+                      const='all',
+                      choices=['all', 'type'],
+                      help='pack subdivided items into texture atlases (all together, or per type)')
+  parser.add_argument('--atlas-size',
+                      metavar='<pixels>',
+                      type=int,
+                      default=4096,
+                      help='maximum width and height of an atlas')
+  parser.add_argument('--convex',
+                      default=False,
+                      action='store_true',
+                      help='decompose static colliders into convex shapes')
+  parser.add_argument('--collider-vertices',
+                      metavar='<vertices>',
+                      type=int,
+                      help='vertex budget of each static collider (adapts the simplification error; at least 3); with --convex, of its outline, before decomposition')
+  parser.add_argument('-f', '--format',
+                      default='png',
+                      choices=['png', 'webp'],
+                      help='image format of subdivided items (webp is lossless)')
+  parser.add_argument('--compression',
+                      metavar='0-9',
+                      type=int,
+                      choices=range(10),
+                      help='PNG compression level (0 is fastest, 9 is smallest)')
+  parser.add_argument('--trim',
+                      default=False,
+                      action='store_true',
+                      help='trim fully transparent margins from subdivided items')
+  parser.add_argument('--chunk-size',
+                      metavar='<pixels>',
+                      type=int,
+                      help='split items into sub-scenes of a grid with cells of this size, for streaming')
+  parser.add_argument('-b', '--bake',
+                      metavar='<type>',
+                      nargs='*',
+                      help='composite deconstruct layers of these types (default: sprite) into background tiles')
+  parser.add_argument('--bake-tile',
+                      metavar='<pixels>',
+                      type=int,
+                      default=1024,
+                      help='size of baked background tiles')
+  parser.add_argument('-s', '--scale',
+                      metavar='<factor>',
+                      type=float,
+                      default=1,
+                      help='build the level downscaled by this factor (e.g. 0.5), with textures to match')
+  parser.add_argument('--profile',
+                      metavar='<report file>',
+                      type=str,
+                      help='write per-stage timings and counters (JSON) to this file')
+
+# gets keyword arguments of create_level from parsed build arguments (see add_build_arguments)
+def build_options(parser, args):
+  bake_types = args.bake
+  if bake_types is not None:
+    if len(bake_types) == 0:
+      bake_types = ['sprite']
+    if any([t in INTERACTIVE_TYPES for t in bake_types]):
+      parser.error('interactive types (' + ', '.join(INTERACTIVE_TYPES) + ') can\'t be baked')
+  if args.scale <= 0:
+    parser.error('--scale must be positive')
+  if args.collider_vertices is not None and args.collider_vertices < 3:
+    parser.error('--collider-vertices must be at least 3 (a triangle)')
+  return {'jobs':args.jobs,
+          'threads':args.threads,
+          'cache_dir':args.cache,
+          'cache_max_bytes':args.cache_size * 1024**2,
+          'tile_bytes':None if args.tile_mb is None else args.tile_mb * 1024**2,
+          'atlas':args.atlas,
+          'atlas_max_size':args.atlas_size,
+          'convex_colliders':args.convex,
+          'max_collider_vertices':args.collider_vertices,
+          'trim':args.trim,
+          'image_format':args.format,
+          'compression':args.compression,
+          'chunk_size':args.chunk_size,
+          'bake_types':bake_types,
+          'bake_tile_size':args.bake_tile,
+          'scale':args.scale
+         }
+
+# command line interface; builds a level (argv defaults to the command line)
+def main(argv=None):
   parser = argparse.ArgumentParser(description='Constructs a godot node tree (scene file) from image layers')
   parser.add_argument('-p', '--passthrough',
                       metavar='<passthrough path>',
                       type=str,
                       nargs='*',
+                      default=[],
                       help='file(s) or director(y|ies) containing files to be passed through')
   parser.add_argument('-d', '--deconstruct',
                       metavar='<deconstruct path>',
                       type=str,
                       nargs='*',
+                      default=[],
                       help='file(s) or director(y|ies) containing files to be deconstructed')
+  parser.add_argument('-m', '--manifest',
+                      metavar='<subdivided path>',
+                      type=str,
+                      nargs='*',
+                      default=[],
+                      help='folder(s) of subdivided items with a manifest (from subdivide.py/deconstruct.py), or director(y|ies) of them')
   parser.add_argument('-n', '--name',
                       metavar='<level name>',
                       type=str,
                       default='level.tscn',
-                      help='name of output level file')
-  parser.add_argument('-o', '--output',
-                      metavar='<output file>',
-                      type=str,
-                      help='directory for map file and requesite assets')
-  parser.add_argument('-v', '--verbose',
+                      help='name of output level file (.tscn for a text scene, .scn for a binary scene)')
+  add_build_arguments(parser)
+  parser.add_argument('-w', '--watch',
                       default=False,
                       action='store_true',
-                      help='do verbose output logging')
-  args = parser.parse_args()
-  create_level(args.passthrough, args.deconstruct, args.output, args.name, args.verbose)
\ No newline at end of file
+                      help='stay running, and rebuild the level whenever an input file changes')
+  parser.add_argument('--interval',
+                      metavar='<seconds>',
+                      type=float,
+                      default=0.25,
+                      help='how often to check inputs for changes, in watch mode')
+  args = parser.parse_args(argv)
+  options = build_options(parser, args)
+  if args.watch:
+    if len(args.manifest) > 0 or args.atlas is not None or args.chunk_size is not None or args.bake is not None or args.scale != 1 or args.profile is not None:
+      parser.error('--manifest, --atlas, --chunk-size, --bake, --scale and --profile are not supported in watch mode')
+    try:
+      watch_level(args.passthrough, args.deconstruct, args.output, args.name, args.verbose, args.interval, args.jobs, args.threads, args.cache, options['cache_max_bytes'], options['tile_bytes'], args.convex, args.collider_vertices, args.trim, args.format, args.compression)
+    except KeyboardInterrupt:
+      pass
+    return
+  with instrument.stage('create_level'):
+    report = create_level(args.passthrough, args.deconstruct, args.output, args.name, args.verbose, manifest_files=args.manifest, **options)
+  if args.verbose:
+    print_type_report(report)
+  if args.profile is not None:
+    instrument.write_report(args.profile, asset_types=report)
+
+if __name__ == '__main__':
+  main()
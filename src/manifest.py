@@ -0,0 +1,66 @@
+# manifest.py
+# reads and writes a layer's manifest: a single compact JSON file, describing
+# every item of the layer (and the image file it was saved to)
+
+import json
+import lod
+import os
+
+MANIFEST_NAME = 'manifest.json'
+
+# writes the manifest of items (see subdivide.analyze) saved to out_folder
+# each item's image is expected at <name>.<format> in out_folder (see subdivide.save_item)
+# layer_file is the layer the items were found in, for reference
+# scales are the factors of items' variants, if saved too (see lod.variant_name)
+def write(out_folder, items, layer_file=None, scales=None):
+  records = []
+  for item in items:
+    metadata = item['metadata']
+    record = {'name':item['name'],
+              'file':item['name'] + '.' + item.get('format', 'png'),
+              'center':[metadata['center']['x'], metadata['center']['y']],
+              'rotation':metadata['rotation'],
+              'dimensions':[metadata['dimensions']['width'], metadata['dimensions']['height']]
+             }
+    # colliders are flattened outlines ([x0, y0, x1, y1, ...]); None if not computed
+    if item.get('colliders') is not None:
+      record['colliders'] = [[int(v) for point in points for v in point] for points in item['colliders']]
+    records.append(record)
+  manifest_path = os.path.join(out_folder, MANIFEST_NAME)
+  with open(manifest_path, 'w') as manifest_file:
+    contents = {'layer':layer_file, 'items':records}
+    if scales:
+      contents['scales'] = scales
+    json.dump(contents, manifest_file, separators=(',', ':'))
+  return manifest_path
+
+# reads the manifest of a folder (written by write)
+# returns a list of items (as in subdivide.analyze, without images), each with:
+  # path: path of the item's image file
+# if scale is given (other than 1), the items' variants at that scale are read (see lod.scale_item)
+def read(folder, scale=None):
+  with open(os.path.join(folder, MANIFEST_NAME), 'r') as manifest_file:
+    manifest = json.load(manifest_file)
+  if scale not in [None, 1] and scale not in manifest.get('scales', []):
+    raise Exception('Items of ' + folder + ' have no variants at scale ' + str(scale) + '.')
+  items = []
+  for record in manifest['items']:
+    colliders = None
+    if 'colliders' in record:
+      colliders = [list(zip(flat[0::2], flat[1::2])) for flat in record['colliders']]
+    items.append({'name':record['name'],
+                  'path':os.path.join(folder, record['file']),
+                  'image':None,
+                  'metadata':{'center':{'x':record['center'][0], 'y':record['center'][1]},
+                              'rotation':record['rotation'],
+                              'dimensions':{'width':record['dimensions'][0], 'height':record['dimensions'][1]}
+                             },
+                  'colliders':colliders
+                 })
+  if scale not in [None, 1]:
+    items = [lod.scale_item(item, scale) for item in items]
+  return items
+
+# checks whether a folder has a manifest
+def exists(folder):
+  return os.path.isfile(os.path.join(folder, MANIFEST_NAME))
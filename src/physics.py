@@ -1,17 +1,15 @@
 from drawntype import DrawnType
 from math import radians
-import yaml
 
 class Physics(DrawnType):
 
-  def __init__(self, name, res_image_path, meta_path, start_ext_id, start_sub_id, parent='.'):
-    super().__init__(name, start_ext_id, start_sub_id, node_type='RigidBody2D', parent=parent)
+  def __init__(self, name, res_image_path, start_ext_id, start_sub_id, parent='.', item=None, textures=None, region=None):
+    super().__init__(name, start_ext_id, start_sub_id, node_type='RigidBody2D', parent=parent, textures=textures)
 
     self.node_string = self._node_string(self.name, self.node_type, self.parent)
 
     # load metadata into dict
-    with open(meta_path, 'r') as meta_file:
-      metadata = yaml.safe_load(meta_file)
+    metadata = self._load_metadata(item)
     
     # add transform info
     if 'center' in metadata:
@@ -20,10 +18,9 @@ class Physics(DrawnType):
       self.node_string += f'rotation = {radians(metadata["rotation"])}\n'
 
     # add sprite node manually (different process for metadata)
-    used_ext_id = self._get_ext_id_safe()
+    texture, self.ext_resources_string, self.sub_resources_string = self._texture_resource(res_image_path, region)
     self.node_string += self._node_string(name + '_sprite', 'Sprite', self.name)
-    self.ext_resources_string = self._ext_resource_string(res_image_path, 'Texture', used_ext_id)
-    self.node_string += f'texture = ExtResource( {used_ext_id} )\n'
+    self.node_string += f'texture = {texture}\n'
 
     # add collision polygon
     self.node_string += self._node_string(name + '_collider', 'CollisionPolygon2D', self.name)
@@ -33,8 +30,15 @@ class Physics(DrawnType):
       corners_arr = [delta_x, delta_y, delta_x, -delta_y, -delta_x, -delta_y, -delta_x, delta_y]
       self.node_string += f'polygon = PoolVector2Array( {", ".join([str(el) for el in corners_arr])})\n'
 
+  @classmethod
+  def create(cls, name, start_ext_id, start_sub_id, res_image_path=None, full_image_path=None, item=None, textures=None, region=None, **options):
+    return cls(name, res_image_path, start_ext_id, start_sub_id, item=item, textures=textures, region=region)
+
   def get_ext_resources_string(self):
     return self.ext_resources_string
 
+  def get_sub_resources_string(self):
+    return self.sub_resources_string
+
   def get_node_string(self):
     return self.node_string
\ No newline at end of file
@@ -1,63 +1,190 @@
 # scene.py
 # defines an object to store, write .tscn files
 
-from drawntype import DrawnType
-from sprite import Sprite
-from static import Static
-from physics import Physics
+from drawntype import DrawnType, get_type
+import instrument
+import json
+from math import cos, radians, sin
+import os
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
 
 class Scene:
 
-  TYPES = ['sprite', 'static', 'physics', 'items', 'platforms']
+  # nodes are kept in memory up to this size, then spooled to disk until written
+  SPOOL_MAX_BYTES = 16 * 1024 * 1024
 
-  def __init__(self, level_name=None):
-    # populate initial lines
-    self.header = '[gd_scene load_steps=1 format=2]\n'
+  # convex_colliders, max_collider_vertices: see Static (convex, max_vertices)
+  # a scene without a root node, with ids from start_ext_id/start_sub_id, is a part of
+  # another scene (see write_scenes)
+  def __init__(self, level_name=None, convex_colliders=False, max_collider_vertices=None, root=True, start_ext_id=1, start_sub_id=1):
     if level_name is None:
       level_name = 'level'
-    self.nodes = '[node name="' + level_name + '" type="Node2D"]\n\n'
+    # sections are collected as fragments (never concatenated), and streamed out
+    self.nodes = SpooledTemporaryFile(max_size=self.SPOOL_MAX_BYTES, mode='w+')
+    if root:
+      self.nodes.write('[node name="' + level_name + '" type="Node2D"]\n\n')
     # vars
-    self.ext_resources = ''
-    self.sub_resources = ''
-    self.curr_ext_resource_id = 1
-    self.curr_sub_resource_id = 1
+    self.ext_resources = []
+    self.sub_resources = []
+    self.start_ext_resource_id = start_ext_id
+    self.start_sub_resource_id = start_sub_id
+    self.curr_ext_resource_id = start_ext_id
+    self.curr_sub_resource_id = start_sub_id
+    # textures declared so far (path -> ext id); each is declared once
+    self.textures = {}
+    # options passed to every type (see DrawnType.create)
+    self.type_options = {'convex':convex_colliders, 'max_vertices':max_collider_vertices}
 
-  # adds a drawn type, optionally linking an asset and metadata
-  def add_type(self, name, drawn_type=None, res_asset_path=None, full_asset_path=None, meta_path=None):
+  # adds a drawn type, optionally linking an asset
+  # item (from subdivide.analyze, or manifest.read) supplies metadata/colliders
+  # region (x, y, width, height) uses part of the asset (an atlas) as the texture
+  def add_type(self, name, drawn_type=None, res_asset_path=None, full_asset_path=None, item=None, region=None):
+    with instrument.stage('add_type'):
+      self._add_type(name, drawn_type, res_asset_path, full_asset_path, item, region)
+    instrument.count('nodes')
+
+  def _add_type(self, name, drawn_type, res_asset_path, full_asset_path, item, region):
     # make asset path safe
     if res_asset_path is not None:
       res_asset_path = res_asset_path.replace('\\', '/')
     
-    add_type = DrawnType(name, start_ext_id=self.curr_ext_resource_id, start_sub_id=self.curr_sub_resource_id)
-    # break out for specific node types
-    if drawn_type is not None and drawn_type in self.TYPES:
-      if drawn_type == 'sprite':
-        add_type = Sprite(name, res_asset_path, meta_path=meta_path, start_ext_id=self.curr_ext_resource_id, start_sub_id=self.curr_sub_resource_id)
-      elif drawn_type == 'static':
-        add_type = Static(name, res_asset_path, full_asset_path, self.curr_ext_resource_id, self.curr_sub_resource_id, meta_path=meta_path)
-      elif drawn_type == 'platforms':
-        add_type = Static(name, res_asset_path, full_asset_path, self.curr_ext_resource_id, self.curr_sub_resource_id, meta_path=meta_path, one_way=True)
-      elif drawn_type == 'physics' or drawn_type == 'items':
-        add_type = Physics(name, res_asset_path, meta_path, self.curr_ext_resource_id, self.curr_sub_resource_id)
-    elif res_asset_path is not None:
+    # look up the registered type (see drawntype.register)
+    registered = None if drawn_type is None else get_type(drawn_type)
+    if registered is None and res_asset_path is not None:
       # use sprites, if asset path exists
-      add_type = Sprite(name, res_asset_path, meta_path=meta_path, start_ext_id=self.curr_ext_resource_id, start_sub_id=self.curr_sub_resource_id)
-    
+      registered = get_type('sprite')
+    type_class, options = (DrawnType, {}) if registered is None else registered
+    add_type = type_class.create(name, self.curr_ext_resource_id, self.curr_sub_resource_id, res_asset_path, full_asset_path, item, self.textures, region, **{**self.type_options, **options})
+
     # add node, external, sub content
-    self.nodes += add_type.get_node_string() + '\n'
-    self.ext_resources += add_type.get_ext_resources_string()
-    self.sub_resources += add_type.get_sub_resources_string()
+    self.nodes.write(add_type.get_node_string() + '\n')
+    self.ext_resources.append(add_type.get_ext_resources_string())
+    self.sub_resources.append(add_type.get_sub_resources_string())
     # update id's
     self.curr_ext_resource_id = add_type.get_last_ext_id()
     self.curr_sub_resource_id = add_type.get_last_sub_id()
 
+  # number of resources declared by this scene
+  def resource_count(self):
+    return (self.curr_ext_resource_id - self.start_ext_resource_id) + (self.curr_sub_resource_id - self.start_sub_resource_id)
+
+  # gets the header; loads each resource, then the scene itself
+  def header_string(self):
+    return self._header_string(self.resource_count())
+
+  @staticmethod
+  def _header_string(resource_count):
+    return f'[gd_scene load_steps={resource_count + 1} format=2]\n'
+
   def write_scene(self, out_path):
+    Scene.write_scenes(out_path, [self])
+
+  # writes scenes with distinct ids (the first with a root node) as a single scene file
+  # scenes are written in Godot's binary format if out_path ends with .scn (see scn.py)
+  @staticmethod
+  def write_scenes(out_path, scenes):
+    with instrument.stage('write_scene'):
+      Scene._write_scenes(out_path, scenes)
+    instrument.count('bytes_written', os.path.getsize(out_path))
+
+  @staticmethod
+  def _write_scenes(out_path, scenes):
+    if out_path.endswith('.scn'):
+      import scn
+      scn.write(out_path, Scene._fragment_lines([s.ext_resources for s in scenes]), Scene._fragment_lines([s.sub_resources for s in scenes]), Scene._node_lines(scenes))
+      return
     with open(out_path, 'w') as out_file:
       # write header
-      out_file.write(self.header + '\n')
-      out_file.write(self.ext_resources + '\n')
-      out_file.write(self.sub_resources + '\n')
-      out_file.writelines(self.nodes)
+      out_file.write(Scene._header_string(sum([s.resource_count() for s in scenes])) + '\n')
+      for s in scenes:
+        out_file.writelines(s.ext_resources)
+      out_file.write('\n')
+      for s in scenes:
+        out_file.writelines(s.sub_resources)
+      out_file.write('\n')
+      # stream nodes; leave them in place, so more can be added
+      for s in scenes:
+        s.nodes.seek(0)
+        copyfileobj(s.nodes, out_file)
+        s.nodes.seek(0, 2)
+
+  # gets the lines of lists of fragments
+  @staticmethod
+  def _fragment_lines(fragment_lists):
+    for fragments in fragment_lists:
+      for fragment in fragments:
+        yield from fragment.splitlines()
+
+  # streams the node lines of scenes; leaves them in place, so more can be added
+  @staticmethod
+  def _node_lines(scenes):
+    for s in scenes:
+      s.nodes.seek(0)
+      yield from s.nodes
+      s.nodes.seek(0, 2)
+
+# a scene split into a grid of sub-scenes (chunks) of cell_size pixels, by item center
+# each chunk is written to its own scene, instanced (as a PackedScene) by the main scene,
+# with a spatial index of all chunks, so that a game can stream them in
+# nodes without items (e.g. passthrough backgrounds) stay in the main scene
+class ChunkedScene(Scene):
+
+  def __init__(self, cell_size, level_name=None, convex_colliders=False, max_collider_vertices=None):
+    super().__init__(level_name, convex_colliders, max_collider_vertices)
+    self.cell_size = cell_size
+    self.chunks = {} # cell (x, y) -> Scene
+    self.bounds = {} # cell (x, y) -> [min x, min y, max x, max y] of its items
+
+  def add_type(self, name, drawn_type=None, res_asset_path=None, full_asset_path=None, item=None, region=None):
+    if item is None:
+      super().add_type(name, drawn_type, res_asset_path, full_asset_path, item, region)
+      return
+    metadata = item['metadata']
+    center = (metadata['center']['x'], metadata['center']['y'])
+    cell = (int(center[0] // self.cell_size), int(center[1] // self.cell_size))
+    if cell not in self.chunks:
+      self.chunks[cell] = Scene(f'chunk_{cell[0]}_{cell[1]}', self.type_options['convex'], self.type_options['max_vertices'])
+    self.chunks[cell].add_type(name, drawn_type, res_asset_path, full_asset_path, item, region)
+    # extend the chunk's bounds by the item's (rotated) bounding rect
+    half_width = metadata['dimensions']['width'] / 2
+    half_height = metadata['dimensions']['height'] / 2
+    angle = radians(metadata['rotation'])
+    extent_x = abs(half_width * cos(angle)) + abs(half_height * sin(angle))
+    extent_y = abs(half_width * sin(angle)) + abs(half_height * cos(angle))
+    item_bounds = [center[0] - extent_x, center[1] - extent_y, center[0] + extent_x, center[1] + extent_y]
+    bounds = self.bounds.setdefault(cell, item_bounds)
+    self.bounds[cell] = [min(bounds[0], item_bounds[0]), min(bounds[1], item_bounds[1]), max(bounds[2], item_bounds[2]), max(bounds[3], item_bounds[3])]
+
+  # writes each chunk to chunks/<level name>/, with an index (index.json) of them, then the
+  # main scene (to out_path); paths are relative to the folder of out_path (the project root)
+  # chunks are written in the format (extension) of out_path
+  def write_scene(self, out_path):
+    out_dir = os.path.dirname(out_path)
+    level_name, scene_ext = os.path.splitext(os.path.basename(out_path))
+    chunk_dir = os.path.join(out_dir, 'chunks', level_name)
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    # instance chunks from the main scene, through a part after its own resources
+    instances = Scene(root=False, start_ext_id=self.curr_ext_resource_id, start_sub_id=self.curr_sub_resource_id)
+    index = {'cell_size':self.cell_size, 'chunks':[]}
+    for cell in sorted(self.chunks):
+      name = f'chunk_{cell[0]}_{cell[1]}'
+      chunk_path = os.path.join(chunk_dir, name + scene_ext)
+      self.chunks[cell].write_scene(chunk_path)
+      res_path = os.path.relpath(chunk_path, out_dir).replace('\\', '/')
+      ext_id = instances.curr_ext_resource_id
+      instances.ext_resources.append(DrawnType._ext_resource_string(res_path, 'PackedScene', ext_id))
+      instances.nodes.write(f'[node name="{name}" parent="." instance=ExtResource( {ext_id} )]\n\n')
+      instances.curr_ext_resource_id += 1
+      index['chunks'].append({'name':name,
+                              'cell':list(cell),
+                              'scene':'res://' + res_path,
+                              'bounds':self.bounds[cell]
+                             })
+    with open(os.path.join(chunk_dir, 'index.json'), 'w') as index_file:
+      json.dump(index, index_file, indent=2)
+    Scene.write_scenes(out_path, [self, instances])
 
 # test script
 if __name__ == '__main__':
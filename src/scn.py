@@ -0,0 +1,360 @@
+# scn.py
+# writes scenes in Godot's binary resource format (.scn), from the text (.tscn)
+# sections built by Scene; also reads them back, to compare with the text scene
+# targets Godot 3 (binary resource format 2, with a PackedScene as the main resource)
+
+import re
+import struct
+
+# variant types (as in Godot's resource_format_binary.cpp)
+VARIANT_BOOL = 2
+VARIANT_INT = 3
+VARIANT_STRING = 5
+VARIANT_VECTOR2 = 10
+VARIANT_RECT2 = 11
+VARIANT_OBJECT = 24
+VARIANT_DICTIONARY = 26
+VARIANT_ARRAY = 30
+VARIANT_INT_ARRAY = 32
+VARIANT_STRING_ARRAY = 34
+VARIANT_VECTOR2_ARRAY = 37
+VARIANT_INT64 = 40
+VARIANT_DOUBLE = 41
+OBJECT_INTERNAL_RESOURCE = 2
+OBJECT_EXTERNAL_RESOURCE_INDEX = 3
+# node type of instanced nodes (see SceneState)
+TYPE_INSTANCED = 0x7FFFFFFF
+PACKED_SCENE_VERSION = 2
+FORMAT_VERSION = 2
+
+_tag_re = re.compile(r'^\[(\w+)(.*)\]$')
+_field_re = re.compile(r'(\w+)=("[^"]*"|\w+\( \d+ \)|-?\d+)')
+_ref_re = re.compile(r'^(ExtResource|SubResource)\( (\d+) \)$')
+_call_re = re.compile(r'^(Vector2|Rect2|PoolVector2Array)\(\s*(.*?)\s*\)$')
+
+# values are kept as tagged tuples, so that text and binary scenes compare equal:
+  # ('ext', path), ('sub', id), ('vector2', x, y), ('rect2', x, y, w, h),
+  # ('vector2_array', (x0, y0, x1, y1, ...)); vectors are single precision (as in Godot)
+  # bools, ints and floats are kept as they are
+def _float32(value):
+  return struct.unpack('<f', struct.pack('<f', float(value)))[0]
+
+def _parse_value(text, ext_paths):
+  ref = _ref_re.match(text)
+  if ref is not None:
+    if ref.group(1) == 'ExtResource':
+      return ('ext', ext_paths[int(ref.group(2))])
+    return ('sub', int(ref.group(2)))
+  call = _call_re.match(text)
+  if call is not None:
+    numbers = tuple([_float32(n) for n in call.group(2).split(',') if n.strip() != ''])
+    return (call.group(1).lower().replace('poolvector2array', 'vector2_array'),) + ((numbers,) if call.group(1) == 'PoolVector2Array' else numbers)
+  if text in ['true', 'false']:
+    return text == 'true'
+  if re.match(r'^-?\d+$', text):
+    return int(text)
+  return float(text)
+
+def _parse_fields(text):
+  return {key: value.strip('"') for key, value in _field_re.findall(text)}
+
+# parses text scene sections (each an iterable of lines) into a scene graph:
+  # ext: list of (type, path), in order of id
+  # sub: list of (id, type, [(property, value)])
+  # nodes: list of {'name', 'type', 'parent', 'instance', 'properties':[(property, value)]}
+    # parent is a path ('.' for children of the root; None for the root)
+    # instance is the path of an instanced scene (and type is None), or None
+def parse_text(ext_lines, sub_lines, node_lines):
+  ext = []
+  ext_paths = {} # id -> path
+  for line in ext_lines:
+    match = _tag_re.match(line.strip())
+    if match is not None:
+      fields = _parse_fields(match.group(2))
+      ext_paths[int(fields['id'])] = fields['path']
+      ext.append((int(fields['id']), fields['type'], fields['path']))
+  ext = [(ext_type, path) for _, ext_type, path in sorted(ext)]
+
+  sections = []
+  for lines in [sub_lines, node_lines]:
+    entries = []
+    for line in lines:
+      line = line.strip()
+      match = _tag_re.match(line)
+      if match is not None:
+        entries.append((_parse_fields(match.group(2)), []))
+      elif ' = ' in line:
+        key, value = line.split(' = ', 1)
+        entries[-1][1].append((key, _parse_value(value, ext_paths)))
+    sections.append(entries)
+
+  sub = [(int(fields['id']), fields['type'], properties) for fields, properties in sections[0]]
+  nodes = []
+  for fields, properties in sections[1]:
+    instance = None
+    if 'instance' in fields:
+      instance = _parse_value(fields['instance'], ext_paths)[1]
+    nodes.append({'name':fields['name'],
+                  'type':fields.get('type'),
+                  'parent':fields.get('parent'),
+                  'instance':instance,
+                  'properties':properties
+                 })
+  return {'ext':ext, 'sub':sub, 'nodes':nodes}
+
+# reads a text scene file (.tscn) into a scene graph (see parse_text)
+def read_text(path):
+  sections = {'ext_resource':[], 'sub_resource':[], 'node':[]}
+  lines = None
+  with open(path, 'r') as text_file:
+    for line in text_file:
+      match = _tag_re.match(line.strip())
+      if match is not None:
+        lines = sections.get(match.group(1))
+      if lines is not None:
+        lines.append(line)
+  return parse_text(sections['ext_resource'], sections['sub_resource'], sections['node'])
+
+# binary encoding
+
+def _u32(value):
+  return struct.pack('<I', value & 0xFFFFFFFF)
+
+def _string(text):
+  data = text.encode('utf-8') + b'\0'
+  return _u32(len(data)) + data
+
+class _Encoder:
+
+  def __init__(self, ext):
+    self.ext_indices = {path: i for i, (_, path) in enumerate(ext)}
+    self.strings = {} # string table: string -> index
+
+  def string_index(self, text):
+    return self.strings.setdefault(text, len(self.strings))
+
+  def variant(self, value):
+    if isinstance(value, bool):
+      return _u32(VARIANT_BOOL) + _u32(int(value))
+    if isinstance(value, int):
+      if -2**31 <= value < 2**31:
+        return _u32(VARIANT_INT) + struct.pack('<i', value)
+      return _u32(VARIANT_INT64) + struct.pack('<q', value)
+    if isinstance(value, float):
+      return _u32(VARIANT_DOUBLE) + struct.pack('<d', value)
+    if isinstance(value, str):
+      return _u32(VARIANT_STRING) + _string(value)
+    if isinstance(value, dict):
+      return _u32(VARIANT_DICTIONARY) + _u32(len(value)) + b''.join([self.variant(k) + self.variant(v) for k, v in value.items()])
+    if isinstance(value, list):
+      return _u32(VARIANT_ARRAY) + _u32(len(value)) + b''.join([self.variant(v) for v in value])
+    tag = value[0]
+    if tag == 'ext':
+      return _u32(VARIANT_OBJECT) + _u32(OBJECT_EXTERNAL_RESOURCE_INDEX) + _u32(self.ext_indices[value[1]])
+    if tag == 'sub':
+      return _u32(VARIANT_OBJECT) + _u32(OBJECT_INTERNAL_RESOURCE) + _u32(value[1])
+    if tag == 'vector2':
+      return _u32(VARIANT_VECTOR2) + struct.pack('<2f', *value[1:])
+    if tag == 'rect2':
+      return _u32(VARIANT_RECT2) + struct.pack('<4f', *value[1:])
+    if tag == 'vector2_array':
+      return _u32(VARIANT_VECTOR2_ARRAY) + _u32(len(value[1]) // 2) + struct.pack(f'<{len(value[1])}f', *value[1])
+    if tag == 'int_array':
+      return _u32(VARIANT_INT_ARRAY) + _u32(len(value[1])) + struct.pack(f'<{len(value[1])}i', *value[1])
+    if tag == 'string_array':
+      return _u32(VARIANT_STRING_ARRAY) + _u32(len(value[1])) + b''.join([_string(s) for s in value[1]])
+    raise Exception('Unsupported scene value ' + str(value) + '.')
+
+  # a resource: type, then its properties (by string table index)
+  def resource(self, res_type, properties):
+    data = _string(res_type) + _u32(len(properties))
+    for key, value in properties:
+      data += _u32(self.string_index(key)) + self.variant(value)
+    return data
+
+# packs scene nodes as a PackedScene's _bundled dictionary (see SceneState::get_bundled)
+def _bundle(nodes):
+  names = {}
+  variants = []
+  variant_indices = {} # (hashable) value -> index
+  def name_index(name):
+    return names.setdefault(name, len(names))
+  def variant_index(value):
+    key = (type(value), value)
+    if key not in variant_indices:
+      variant_indices[key] = len(variants)
+      variants.append(value)
+    return variant_indices[key]
+
+  node_indices = {} # path (from the root) -> index
+  packed = []
+  for i, node in enumerate(nodes):
+    if node['parent'] is None:
+      parent = -1
+      node_indices['.'] = i
+    else:
+      parent = node_indices[node['parent']]
+      node_indices[node['name'] if node['parent'] == '.' else node['parent'] + '/' + node['name']] = i
+    owner = -1 if parent == -1 else 0
+    if node['instance'] is None:
+      node_type, instance = name_index(node['type']), -1
+    else:
+      node_type, instance = TYPE_INSTANCED, variant_index(('ext', node['instance']))
+    packed += [parent, owner, node_type, name_index(node['name']), instance, len(node['properties'])]
+    for key, value in node['properties']:
+      packed += [name_index(key), variant_index(value)]
+    packed.append(0) # groups
+  return {'names':('string_array', tuple(names)),
+          'variants':variants,
+          'node_count':len(nodes),
+          'nodes':('int_array', tuple(packed)),
+          'conn_count':0,
+          'conns':('int_array', ()),
+          'node_paths':[],
+          'editable_instances':[],
+          'version':PACKED_SCENE_VERSION
+         }
+
+# encodes a scene graph (see parse_text) as a binary scene
+def encode(graph):
+  encoder = _Encoder(graph['ext'])
+  resources = [('local://' + str(sub_id), encoder.resource(sub_type, properties)) for sub_id, sub_type, properties in graph['sub']]
+  resources.append(('', encoder.resource('PackedScene', [('_bundled', _bundle(graph['nodes']))])))
+
+  header = b'RSRC' + _u32(0) + _u32(0) + _u32(3) + _u32(0) + _u32(FORMAT_VERSION)
+  header += _string('PackedScene') + struct.pack('<Q', 0) + _u32(0) * 14
+  header += _u32(len(encoder.strings)) + b''.join([_string(s) for s in encoder.strings])
+  header += _u32(len(graph['ext'])) + b''.join([_string(ext_type) + _string(path) for ext_type, path in graph['ext']])
+  # internal resources: path, and offset of its data
+  table_size = 4 + sum([len(_string(path)) + 8 for path, _ in resources])
+  offset = len(header) + table_size
+  table = _u32(len(resources))
+  for path, data in resources:
+    table += _string(path) + struct.pack('<Q', offset)
+    offset += len(data)
+  return header + table + b''.join([data for _, data in resources]) + b'RSRC'
+
+# binary decoding
+
+class _Decoder:
+
+  def __init__(self, data):
+    self.data = data
+    self.pos = 0
+
+  def unpack(self, fmt):
+    values = struct.unpack_from(fmt, self.data, self.pos)
+    self.pos += struct.calcsize(fmt)
+    return values
+
+  def u32(self):
+    return self.unpack('<I')[0]
+
+  def string(self):
+    length = self.u32()
+    text = self.data[self.pos:self.pos + length - 1].decode('utf-8')
+    self.pos += length
+    return text
+
+  def variant(self):
+    kind = self.u32()
+    if kind == VARIANT_BOOL:
+      return self.u32() != 0
+    if kind == VARIANT_INT:
+      return self.unpack('<i')[0]
+    if kind == VARIANT_INT64:
+      return self.unpack('<q')[0]
+    if kind == VARIANT_DOUBLE:
+      return self.unpack('<d')[0]
+    if kind == VARIANT_STRING:
+      return self.string()
+    if kind == VARIANT_DICTIONARY:
+      length = self.u32() & 0x7FFFFFFF
+      return dict([(self.variant(), self.variant()) for _ in range(length)])
+    if kind == VARIANT_ARRAY:
+      return [self.variant() for _ in range(self.u32() & 0x7FFFFFFF)]
+    if kind == VARIANT_OBJECT:
+      obj_type, index = self.u32(), self.u32()
+      return ('ext', self.ext[index][1]) if obj_type == OBJECT_EXTERNAL_RESOURCE_INDEX else ('sub', index)
+    if kind == VARIANT_VECTOR2:
+      return ('vector2',) + self.unpack('<2f')
+    if kind == VARIANT_RECT2:
+      return ('rect2',) + self.unpack('<4f')
+    if kind == VARIANT_VECTOR2_ARRAY:
+      length = self.u32()
+      return ('vector2_array', self.unpack(f'<{2 * length}f'))
+    if kind == VARIANT_INT_ARRAY:
+      length = self.u32()
+      return ('int_array', self.unpack(f'<{length}i'))
+    if kind == VARIANT_STRING_ARRAY:
+      return ('string_array', tuple([self.string() for _ in range(self.u32())]))
+    raise Exception('Unsupported variant type ' + str(kind) + '.')
+
+  def resource(self, offset):
+    self.pos = offset
+    res_type = self.string()
+    properties = []
+    for _ in range(self.u32()):
+      key = self.strings[self.u32()]
+      properties.append((key, self.variant()))
+    return res_type, properties
+
+# unpacks a PackedScene's _bundled dictionary into nodes (as in parse_text)
+def _unbundle(bundled):
+  names = bundled['names'][1]
+  variants = bundled['variants']
+  packed = bundled['nodes'][1]
+  nodes = []
+  paths = []
+  i = 0
+  for _ in range(bundled['node_count']):
+    parent, _, node_type, name, instance, property_count = packed[i:i + 6]
+    i += 6
+    properties = [(names[packed[i + 2 * j]], variants[packed[i + 2 * j + 1]]) for j in range(property_count)]
+    i += 2 * property_count
+    i += 1 + packed[i] # groups
+    name = names[name & ((1 << 18) - 1)]
+    parent_path = None if parent == -1 else paths[parent]
+    paths.append('.' if parent_path is None else (name if parent_path == '.' else parent_path + '/' + name))
+    nodes.append({'name':name,
+                  'type':None if instance != -1 else names[node_type],
+                  'parent':parent_path,
+                  'instance':None if instance == -1 else variants[instance][1],
+                  'properties':properties
+                 })
+  return nodes
+
+# decodes a binary scene (see encode) into a scene graph (see parse_text)
+def decode(data):
+  decoder = _Decoder(data)
+  if decoder.unpack('4s')[0] != b'RSRC':
+    raise Exception('Not a binary resource.')
+  decoder.unpack('<5I')
+  decoder.string()
+  decoder.unpack('<Q14I')
+  decoder.strings = [decoder.string() for _ in range(decoder.u32())]
+  decoder.ext = []
+  for _ in range(decoder.u32()):
+    ext_type = decoder.string()
+    decoder.ext.append((ext_type, decoder.string()))
+  resources = []
+  for _ in range(decoder.u32()):
+    path = decoder.string()
+    resources.append((path, decoder.unpack('<Q')[0]))
+  sub = []
+  for path, offset in resources[:-1]:
+    res_type, properties = decoder.resource(offset)
+    sub.append((int(path.replace('local://', '')), res_type, properties))
+  _, properties = decoder.resource(resources[-1][1])
+  return {'ext':decoder.ext, 'sub':sub, 'nodes':_unbundle(dict(properties)['_bundled'])}
+
+# reads a binary scene file (.scn) into a scene graph (see parse_text)
+def read(path):
+  with open(path, 'rb') as scene_file:
+    return decode(scene_file.read())
+
+# writes text scene sections (see parse_text) as a binary scene
+def write(out_path, ext_lines, sub_lines, node_lines):
+  data = encode(parse_text(ext_lines, sub_lines, node_lines))
+  with open(out_path, 'wb') as out_file:
+    out_file.write(data)
@@ -3,36 +3,277 @@
 
 import argparse
 import cv2
+import instrument
 import numpy as np
 
-def segment(image_path, error_max_px, trans_thresh=0.05):
+# smallest error (in px) tried, when fitting contours to a vertex budget
+MIN_SEGMENT_ERR_PX = 1
+
+# bytes of temporaries per pixel, when converting to gray (BGRA copy, mask, gray)
+GRAY_BYTES_PER_PX = 6
+
+# recolors transparency as white, and converts to grayscale
+def _gray(raw_image, trans_thresh):
+  mod_image = raw_image.copy()
+  trans_mask = raw_image[:,:,3] <= trans_thresh * 255
+  mod_image[trans_mask] = [255, 255, 255, 255]
+  return cv2.cvtColor(mod_image, cv2.COLOR_BGRA2GRAY)
+
+# recolors transparency as white, and binarizes (using Otsu's method)
+# shared by every stage that needs to find drawn items in a layer
+# if tile_bytes is given, the layer is converted in horizontal strips, whose
+# temporaries fit in tile_bytes; only the (1 byte per pixel) result is full-size
+  # conversion is per-pixel and Otsu's threshold is found on the full result,
+  # so the result is identical to the untiled one
+def threshold(raw_image, trans_thresh=0.05, tile_bytes=None):
+  if tile_bytes is None:
+    gray = _gray(raw_image, trans_thresh)
+  else:
+    height, width = raw_image.shape[:2]
+    rows = max(1, tile_bytes // (GRAY_BYTES_PER_PX * width))
+    gray = np.empty((height, width), np.uint8)
+    for top in range(0, height, rows):
+      gray[top:top+rows] = _gray(raw_image[top:top+rows], trans_thresh)
+  # binarize in place
+  return cv2.threshold(gray,0,255,cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU,gray)[1]
+
+# approximates a single contour with segments
+def simplify(contour, error_max_px):
+  seg_clean = _approximate(contour, error_max_px)
+  instrument.count('collider_vertices', len(seg_clean))
+  return seg_clean
+
+def _approximate(contour, error_px):
+  seg_raw = cv2.approxPolyDP(contour, error_px, True) #in form [..., [[x,y]],...]
+  return [(vertex[0][0], vertex[0][1]) for vertex in seg_raw] #ctr is list of tuples
+
+# approximates contours with segments, using at most max_vertices (in total)
+# the error adapts to the budget: it's the smallest (from MIN_SEGMENT_ERR_PX) that fits
+# without a budget, error_max_px is used
+# a budget must allow a triangle (3 vertices) per contour; contours that simplify to fewer
+# than 3 vertices (a line, or a point) are simplified again with less error, or dropped if
+# they're still too small (they aren't colliders)
+# if no error fits the budget, the largest tried is used, and the result counted as over budget
+# with convex colliders, the budget is of the outline, before it's decomposed (see decompose)
+def simplify_all(contours, error_max_px, max_vertices=None):
+  if max_vertices is not None and max_vertices < 3 * len(contours):
+    raise Exception(f'A vertex budget of {max_vertices} is too small for {len(contours)} contour(s); each needs at least 3.')
+  error_px = error_max_px
+  if max_vertices is not None and len(contours) > 0:
+    # contours too small for a triangle still count as one (so they aren't dropped to save vertices)
+    def n_vertices(error_px):
+      return sum([max(3, len(cv2.approxPolyDP(contour, error_px, True))) for contour in contours])
+    # past the largest contour's extent, simplifying further can't help
+    max_error_px = max([np.hypot(*cv2.boundingRect(contour)[2:]) for contour in contours])
+    low = high = MIN_SEGMENT_ERR_PX
+    if n_vertices(low) > max_vertices:
+      # find an error within budget, then bisect towards the smallest
+      while high < max_error_px and n_vertices(high) > max_vertices:
+        low, high = high, high * 2
+      for _ in range(10):
+        mid = (low + high) / 2
+        if n_vertices(mid) > max_vertices:
+          low = mid
+        else:
+          high = mid
+    error_px = high
+  segments = []
+  for contour in contours:
+    points = _approximate(contour, error_px)
+    # a contour simplified to a line is tried again, at smaller errors, for the fewest
+    # vertices of a polygon
+    contour_error_px = error_px
+    while len(points) < 3 and contour_error_px > MIN_SEGMENT_ERR_PX:
+      contour_error_px = max(MIN_SEGMENT_ERR_PX, contour_error_px / 2)
+      points = _approximate(contour, contour_error_px)
+    segments.append(points)
+  kept = [points for points in segments if len(points) >= 3]
+  if len(kept) < len(segments):
+    instrument.count('degenerate_colliders', len(segments) - len(kept))
+  n_kept = sum([len(points) for points in kept])
+  if max_vertices is not None and n_kept > max_vertices:
+    instrument.count('colliders_over_budget')
+  instrument.count('collider_vertices', n_kept)
+  return kept
+
+def _cross(o, a, b):
+  return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+def _area(points):
+  return sum([_cross((0, 0), points[i-1], points[i]) for i in range(len(points))]) / 2
+
+def _is_convex(points):
+  return all([_cross(points[i-2], points[i-1], points[i]) >= 0 for i in range(len(points))])
+
+# checks whether segments ab and cd meet (crossing, or touching)
+def _segments_meet(a, b, c, d):
+  def on_segment(p, q, r):
+    return min(p[0], q[0]) <= r[0] <= max(p[0], q[0]) and min(p[1], q[1]) <= r[1] <= max(p[1], q[1])
+  d1, d2 = _cross(c, d, a), _cross(c, d, b)
+  d3, d4 = _cross(a, b, c), _cross(a, b, d)
+  if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and ((d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)):
+    return True
+  return (d1 == 0 and on_segment(c, d, a)) or (d2 == 0 and on_segment(c, d, b)) or (d3 == 0 and on_segment(a, b, c)) or (d4 == 0 and on_segment(a, b, d))
+
+# checks whether a polygon is simple: no two edges meet, other than neighbours at their vertex
+def _is_simple(points):
+  n = len(points)
+  for i in range(n):
+    for j in range(i + 2, n):
+      if i == 0 and j == n - 1:
+        continue
+      if _segments_meet(points[i], points[(i+1) % n], points[j], points[(j+1) % n]):
+        return False
+  return True
+
+# splits an outline at repeated vertices (where two lobes touch) into loops without repeats
+def _split_loops(points):
+  loops = []
+  loop = []
+  seen = {} # point -> index in loop
+  for p in points:
+    if p in seen:
+      # the points since p's last visit close a loop
+      start = seen[p]
+      loops.append(loop[start:])
+      for q in loop[start + 1:]:
+        del seen[q]
+      loop = loop[:start + 1]
+    else:
+      seen[p] = len(loop)
+      loop.append(p)
+  loops.append(loop)
+  return loops
+
+# triangulates a (positively oriented, simple) polygon by ear clipping; returns index triples
+# returns None if some step finds no ear (the polygon isn't simple)
+def _triangulate(points):
+  idxs = list(range(len(points)))
+  triangles = []
+  while len(idxs) > 3:
+    for k in range(len(idxs)):
+      a, b, c = idxs[k-1], idxs[k], idxs[(k+1) % len(idxs)]
+      if _cross(points[a], points[b], points[c]) <= 0:
+        continue
+      # an ear contains no other vertex
+      tri = (points[a], points[b], points[c])
+      if any([_cross(tri[0], tri[1], points[i]) >= 0 and _cross(tri[1], tri[2], points[i]) >= 0 and _cross(tri[2], tri[0], points[i]) >= 0
+              for i in idxs if points[i] not in tri]):
+        continue
+      triangles.append((a, b, c))
+      del idxs[k]
+      break
+    else:
+      return None
+  triangles.append(tuple(idxs))
+  return triangles
+
+# merges the pieces on either side of the edge (i, j), if they exist and the result is convex
+def _merge_pieces(points, pieces, edges, i, j):
+  p, q = edges.get((i, j)), edges.get((j, i))
+  if p is None or q is None or p == q:
+    return False
+  # p runs j ... i, q runs i ... j
+  p_idxs, q_idxs = pieces[p], pieces[q]
+  p_start, q_start = p_idxs.index(j), q_idxs.index(i)
+  p_idxs = p_idxs[p_start:] + p_idxs[:p_start]
+  q_idxs = q_idxs[q_start:] + q_idxs[:q_start]
+  merged = p_idxs + q_idxs[1:-1]
+  if not _is_convex([points[m] for m in merged]):
+    return False
+  pieces[p] = merged
+  del pieces[q]
+  del edges[(i, j)], edges[(j, i)]
+  for k in range(len(merged)):
+    if (merged[k-1], merged[k]) in edges:
+      edges[(merged[k-1], merged[k])] = p
+  return True
+
+# decomposes a polygon (list of (x, y)) into convex polygons
+# outlines that touch themselves (repeating a vertex) are split into loops, each decomposed
+# returns None if that isn't possible: a loop isn't simple, or is a hole (turns the other way),
+# or pieces don't cover the polygon exactly
+def decompose(points):
+  # drop repeated vertices, and split at vertices visited again
+  points = [(int(p[0]), int(p[1])) for p in points]
+  points = [p for i, p in enumerate(points) if p != points[i-1]]
+  if len(points) < 3:
+    return []
+  area = _area(points)
+  pieces = []
+  for loop in _split_loops(points):
+    # drop collinear vertices, and orient as the outline
+    loop = [p for i, p in enumerate(loop) if _cross(loop[i-1], p, loop[(i+1) % len(loop)]) != 0]
+    if len(loop) < 3:
+      continue
+    if (_area(loop) < 0) != (area < 0):
+      return None
+    if area < 0:
+      loop.reverse()
+    loop_pieces = _decompose_loop(loop)
+    if loop_pieces is None:
+      return None
+    pieces += loop_pieces
+  if abs(sum([_area(piece) for piece in pieces]) - abs(area)) > 1e-6:
+    return None
+  return pieces
+
+# decomposes a simple, positively oriented polygon into convex polygons (None if it isn't simple)
+# triangulates, then removes diagonals while pieces stay convex (Hertel-Mehlhorn),
+# giving at most 4 times the minimal number of pieces
+def _decompose_loop(points):
+  if not _is_simple(points):
+    return None
+  if _is_convex(points):
+    return [points]
+
+  triangles = _triangulate(points)
+  if triangles is None:
+    return None
+  pieces = {}
+  edges = {} # directed edge (i, j) -> piece containing it
+  for n, triangle in enumerate(triangles):
+    if _cross(*[points[i] for i in triangle]) <= 0:
+      continue
+    pieces[n] = list(triangle)
+    for k in range(3):
+      edges[(triangle[k-1], triangle[k])] = n
+  # remove each diagonal (an edge shared by two pieces), if the merge is convex
+  # repeated, as merges can make other merges possible
+  merging = True
+  while merging:
+    merging = False
+    for (i, j) in list(edges.keys()):
+      merging = _merge_pieces(points, pieces, edges, i, j) or merging
+  return [[points[m] for m in piece] for piece in pieces.values()]
+
+# max_vertices is a budget for all contours (see simplify_all)
+def segment(image_path, error_max_px, trans_thresh=0.05, tile_bytes=None, max_vertices=None):
   # open image
   try:
-    raw_image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    with instrument.stage('imread'):
+      raw_image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
   except:
     raise Exception('Failed to open ' + image_path + '.')
-  # recolor transparency as white
-  mod_image = raw_image.copy()
-  trans_mask = raw_image[:,:,3] <= trans_thresh * 255
-  mod_image[trans_mask] = [255, 255, 255, 255]
-  # get all present external (high order) contours (using Otsu's binarization)
-  gray = cv2.cvtColor(mod_image, cv2.COLOR_BGRA2GRAY)
-  thresh = cv2.threshold(gray,0,255,cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)[1]
-  contours = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[0]
+  # get all present external (high order) contours
+  with instrument.stage('threshold'):
+    thresh = threshold(raw_image, trans_thresh, tile_bytes)
+  with instrument.stage('find_contours'):
+    contours = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[0]
+  instrument.count('contours', len(contours))
   # construct segments
-  ctr_segments = []
-  for contour in contours:
-    seg_raw = cv2.approxPolyDP(contour, error_max_px, True) #in form [..., [[x,y]],...]
-    seg_clean = []
-    for vertex in seg_raw:
-      seg_clean.append((vertex[0][0], vertex[0][1])) #ea. ctr is list of tuples
-    ctr_segments.append(seg_clean)
+  with instrument.stage('collider'):
+    ctr_segments = simplify_all(contours, error_max_px, max_vertices)
   return ctr_segments #list of lists of tuples (contours with lists of points)
 
-if __name__ == "__main__":
+# command line interface; segments an image (argv defaults to the command line)
+def main(argv=None):
   parser = argparse.ArgumentParser(description='Segments one (or more) high-order contour(s) present in input image')
   parser.add_argument('filename', metavar='filename', type=str, help='image to segment')
   parser.add_argument('error', metavar='error', type=float, help='maximum error (in px) between segment and input contour')
-  args = parser.parse_args()
+  args = parser.parse_args(argv)
   res = segment(args.filename, args.error)
-  print(res)
\ No newline at end of file
+  print(res)
+
+if __name__ == "__main__":
+  main()
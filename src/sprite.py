@@ -1,35 +1,38 @@
 from drawntype import DrawnType
 from math import radians
-import yaml
 
 class Sprite(DrawnType):
 
-  def __init__(self, name, res_image_path, start_ext_id, start_sub_id, parent='.', meta_path=None):
-    super().__init__(name, start_ext_id, start_sub_id,'Sprite', parent)
+  def __init__(self, name, res_image_path, start_ext_id, start_sub_id, parent='.', item=None, textures=None, region=None):
+    super().__init__(name, start_ext_id, start_sub_id,'Sprite', parent, textures)
 
-    use_id = self._get_ext_id_safe()
-    
-    # add image external resources
-    self.ext_resource_string = self._ext_resource_string(res_image_path, 'Texture', use_id)
+    # add image external resources (and atlas sub-resource, for a region)
+    texture, self.ext_resource_string, self.sub_resource_string = self._texture_resource(res_image_path, region)
 
     # create node, with metadata/parent if existent
     self.node_string = self._node_string(self.name, self.node_type, self.parent)
-    self.node_string += f'texture = ExtResource( {use_id} )\n'
-    if meta_path is not None:
-      # load existent metadata
-      with open(meta_path, 'r') as meta_file:
-        metadata = yaml.safe_load(meta_file)
-        if 'center' in metadata:
-          self.node_string += f'position = Vector2( {metadata["center"]["x"]},{metadata["center"]["y"]} )\n'
-        if 'rotation' in metadata:
-          self.node_string += f'rotation = {radians(metadata["rotation"])}\n'
+    self.node_string += f'texture = {texture}\n'
+    metadata = self._load_metadata(item)
+    if metadata is not None:
+      # use existent metadata
+      if 'center' in metadata:
+        self.node_string += f'position = Vector2( {metadata["center"]["x"]},{metadata["center"]["y"]} )\n'
+      if 'rotation' in metadata:
+        self.node_string += f'rotation = {radians(metadata["rotation"])}\n'
     else:
       # don't center sprite (to preserve spatial relationships)
       self.node_string += 'centered = false\n'
 
+  @classmethod
+  def create(cls, name, start_ext_id, start_sub_id, res_image_path=None, full_image_path=None, item=None, textures=None, region=None, **options):
+    return cls(name, res_image_path, start_ext_id, start_sub_id, item=item, textures=textures, region=region)
+
   def get_ext_resources_string(self):
     return self.ext_resource_string
 
+  def get_sub_resources_string(self):
+    return self.sub_resource_string
+
   def get_node_string(self):
     return self.node_string + '\n'
 
@@ -3,31 +3,31 @@
 
 from drawntype import DrawnType
 from math import radians
-from segment import segment
 from sprite import Sprite
-import yaml
 
 class Static(DrawnType):
 
   MAX_SEGMENT_ERR_PX = 10
 
-  def __init__(self, name, res_image_path, image_full_path, start_ext_id, start_sub_id, parent='.', meta_path=None, one_way=False):
-    super().__init__(name, start_ext_id, start_sub_id, node_type='StaticBody2D', parent=parent)
+  # convex: emit colliders as convex shapes (decomposed here, rather than by Godot at load time)
+  # max_vertices: collider vertex budget (see segment.simplify_all), for colliders made here
+  # (with convex, the budget is of each outline, not of the pieces it's decomposed into)
+  def __init__(self, name, res_image_path, image_full_path, start_ext_id, start_sub_id, parent='.', one_way=False, item=None, textures=None, region=None, convex=False, max_vertices=None):
+    super().__init__(name, start_ext_id, start_sub_id, node_type='StaticBody2D', parent=parent, textures=textures)
 
     # start node string
     self.node_string = self._node_string(self.name, self.node_type, self.parent)
     # get position and rotation, if metadata exists
-    if meta_path is not None:
-      # load existent metadata
-      with open(meta_path, 'r') as meta_file:
-        metadata = yaml.safe_load(meta_file)
-        if 'center' in metadata:
-          self.node_string += f'position = Vector2( {metadata["center"]["x"]},{metadata["center"]["y"]} )\n'
-        if 'rotation' in metadata:
-          self.node_string += f'rotation = {radians(metadata["rotation"])}\n'
+    metadata = self._load_metadata(item)
+    if metadata is not None:
+      # use existent metadata
+      if 'center' in metadata:
+        self.node_string += f'position = Vector2( {metadata["center"]["x"]},{metadata["center"]["y"]} )\n'
+      if 'rotation' in metadata:
+        self.node_string += f'rotation = {radians(metadata["rotation"])}\n'
 
     # create sprite node(s), with myself as parent
-    sprite = Sprite(name + '_sprite', res_image_path, start_ext_id, start_sub_id, parent=self.name)
+    sprite = Sprite(name + '_sprite', res_image_path, start_ext_id, start_sub_id, parent=self.name, textures=textures, region=region)
     self.node_string += sprite.get_node_string()
     self.ext_resources_string = sprite.get_ext_resources_string()
     self.sub_resources_string = sprite.get_sub_resources_string()
@@ -35,20 +35,55 @@ class Static(DrawnType):
     self._curr_ext_id = sprite.get_last_ext_id()
     self._curr_sub_id = sprite.get_last_sub_id()
 
-    # use provided image to create colliders (using segments from segment.py)
-    colliders = segment(image_full_path, self.MAX_SEGMENT_ERR_PX)
-    for idx, points_list in enumerate(colliders):
-      self.polygon_node(idx, points_list, one_way)
+    # create colliders; analyzed items usually carry them (see subdivide.analyze)
+    # otherwise, use provided image (using segments from segment.py)
+    if item is not None and item['colliders'] is not None:
+      colliders = item['colliders']
+    else:
+      # segment (and so cv2) is only loaded when it's needed
+      from segment import segment
+      colliders = segment(image_full_path, self.MAX_SEGMENT_ERR_PX, max_vertices=max_vertices)
+    if convex:
+      # outlines that can't be decomposed (see segment.decompose) stay polygons
+      from segment import decompose
+      n_shapes = 0
+      n_polygons = 0
+      for points_list in colliders:
+        pieces = decompose(points_list)
+        if pieces is None:
+          self.polygon_node(n_polygons, points_list, one_way)
+          n_polygons += 1
+          continue
+        for piece in pieces:
+          self.convex_shape_node(n_shapes, piece, one_way)
+          n_shapes += 1
+    else:
+      for idx, points_list in enumerate(colliders):
+        self.polygon_node(idx, points_list, one_way)
+
+  # options: one_way, convex, max_vertices (see __init__)
+  @classmethod
+  def create(cls, name, start_ext_id, start_sub_id, res_image_path=None, full_image_path=None, item=None, textures=None, region=None, one_way=False, convex=False, max_vertices=None, **options):
+    return cls(name, res_image_path, full_image_path, start_ext_id, start_sub_id, one_way=one_way, item=item, textures=textures, region=region, convex=convex, max_vertices=max_vertices)
 
   def polygon_node(self, idx, points, one_way):
     self.node_string += self._node_string(self.name + '_polygon_' + str(idx), 'CollisionPolygon2D', self.name)
-    self.node_string += 'polygon = PoolVector2Array( '
-    points_string = ""
-    for point in points:
-      points_string += str(point[0]) + ', ' + str(point[1]) + ', '
-    self.node_string += points_string[:-2] + " )\n"
+    self.node_string += 'polygon = PoolVector2Array( ' + self._points_string(points) + " )\n"
+    self.node_string += "one_way_collision = " + ("true\n" if one_way else "false\n")
+
+  # adds a collision shape, using a (convex) ConvexPolygonShape2D sub-resource
+  def convex_shape_node(self, idx, points, one_way):
+    sub_id = self._get_sub_id_safe()
+    self.sub_resources_string += self._sub_resource_string('ConvexPolygonShape2D', sub_id)
+    self.sub_resources_string += 'points = PoolVector2Array( ' + self._points_string(points) + " )\n\n"
+    self.node_string += self._node_string(self.name + '_shape_' + str(idx), 'CollisionShape2D', self.name)
+    self.node_string += f'shape = SubResource( {sub_id} )\n'
     self.node_string += "one_way_collision = " + ("true\n" if one_way else "false\n")
 
+  @staticmethod
+  def _points_string(points):
+    return ', '.join([str(point[0]) + ', ' + str(point[1]) for point in points])
+
   def get_ext_resources_string(self):
     return self.ext_resources_string
 
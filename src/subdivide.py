@@ -3,82 +3,233 @@
 # records metadata about the original translation & orientation of objects
 
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 import cv2
+import instrument
+import lod
+import manifest
+from math import cos, radians, sin
 import numpy as np
 import os
-import yaml
+from segment import threshold, simplify_all
 
-def subdivide(in_file, out_folder, do_output=False):
-  # open file
+# alpha (0-1) at or below which pixels count as transparent
+TRANS_THRESH = 0.05
+# output image formats (lossless; each can be imported by Godot)
+IMAGE_FORMATS = ['png', 'webp']
+
+# encodes an image in image_format; returns the encoded bytes
+# compression is the PNG compression level (0-9; fastest to smallest), if given
+# webp is always lossless
+def encode_image(image, image_format='png', compression=None):
+  params = []
+  if image_format == 'png':
+    if compression is not None:
+      params = [cv2.IMWRITE_PNG_COMPRESSION, compression]
+  elif image_format == 'webp':
+    # quality above 100 is lossless
+    params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+  else:
+    raise Exception('Unknown image format ' + str(image_format) + '.')
+  success, encoded = cv2.imencode('.' + image_format, image, params)
+  if not success:
+    raise Exception('Failed to encode image as ' + image_format + '.')
+  return encoded.tobytes()
+
+# runs func over each tuple of args on a pool of threads, yielding results in order
+# at most 2 * threads items are in flight, so memory stays flat
+# (cv2 releases the GIL, so per-item work runs in parallel)
+def _map_bounded(func, arg_lists, threads=1):
+  if threads <= 1:
+    for args in arg_lists:
+      yield func(*args)
+    return
+  with ThreadPoolExecutor(max_workers=threads) as pool:
+    pending = deque()
+    for args in arg_lists:
+      # run in a copy of the context, to keep instrument.layer
+      pending.append(pool.submit(contextvars.copy_context().run, func, *args))
+      if len(pending) >= 2 * threads:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+# crops (and un-rotates) a single item, given its contour in the layer
+# max_vertices: collider vertex budget (see segment.simplify_all)
+# if trim, fully transparent margins are cut from the crop (moving its center to match)
+def bound_item(raw_image, ctr, i, error_max_px=None, max_vertices=None, trim=False):
+  with instrument.stage('warp'):
+    # get rotated bounding rect
+    rect = cv2.minAreaRect(ctr) #((ctrx, ctry), (width, height), rotation)
+    corners = cv2.boxPoints(rect)
+    box = np.int0(corners)
+    width = int(rect[1][0])
+    height = int(rect[1][1])
+
+    # warp rect into new image; good solution comes from
+    # https://jdhao.github.io/2019/02/23/crop_rotated_rectangle_opencv/
+    src_pts = box.astype("float32")
+    dst_pts = np.array([[0, height-1],
+                        [0, 0],
+                        [width-1, 0],
+                        [width-1, height-1]], dtype="float32")
+    T = cv2.getPerspectiveTransform(src_pts, dst_pts) # transformation matrix
+    warped = cv2.warpPerspective(raw_image, T, (width, height))
+
+  center = rect[0]
+  offset = (0, 0)
+  if trim and warped.ndim == 3 and warped.shape[2] == 4:
+    with instrument.stage('trim'):
+      x, y, trim_width, trim_height = cv2.boundingRect(warped[:, :, 3])
+      if trim_width > 0 and (trim_width, trim_height) != (width, height):
+        # move the center by the (rotated) offset between old and new crop centers
+        dx = x + trim_width / 2 - width / 2
+        dy = y + trim_height / 2 - height / 2
+        angle = radians(rect[2])
+        center = (center[0] + dx * cos(angle) - dy * sin(angle), center[1] + dx * sin(angle) + dy * cos(angle))
+        warped = warped[y:y + trim_height, x:x + trim_width]
+        offset = (x, y)
+        width, height = trim_width, trim_height
+
+  # move item outline into the cropped frame, and simplify
+  colliders = None
+  if error_max_px is not None:
+    with instrument.stage('collider'):
+      local_ctr = cv2.perspectiveTransform(ctr.astype("float32"), T) - np.float32(offset)
+      colliders = simplify_all([np.rint(local_ctr).astype(np.int32)], error_max_px, max_vertices)
+
+  metadata = {'center':{'x':center[0], 'y':center[1]},
+              'rotation':rect[2],
+              'dimensions':{'width':width, 'height':height}
+             }
+  return {'name':'item_' + str(i),
+          'image':warped,
+          'metadata':metadata,
+          'colliders':colliders
+         }
+
+# saves an item's image to out_folder (its metadata goes in the layer's manifest)
+# the image is saved as <name>.<format> (see encode_image)
+def save_item(item, out_folder, do_output=False, compression=None):
+  # save image
+  outfile = os.path.join(out_folder, item['name'] + '.' + item['format'])
+  with instrument.stage('encode'):
+    encoded = encode_image(item['image'], item['format'], compression)
+  instrument.count('bytes_encoded', len(encoded))
   try:
-    raw_image = cv2.imread(in_file, cv2.IMREAD_UNCHANGED)
-    if do_output:
-      print('Opened ' + in_file)
+    with instrument.stage('write_file'), open(outfile, 'wb') as out_file:
+      out_file.write(encoded)
   except:
-    raise Exception('Failed to read ' + str(in_file) +'. Does it exist?')
-  if not os.path.isdir(out_folder):
-        raise Exception("Output folder " + out_folder + " does not exist.")
+    raise Exception("Failed to write to " + outfile + ".")
+  instrument.count('bytes_written', os.path.getsize(outfile))
+  if do_output:
+    print('Saved ' + os.path.basename(outfile) + ' to ' + out_folder)
 
-  # recolor transparency as white (using threshold)
-  trans_thresh = 0.05
-  mod_image = raw_image.copy()
-  trans_mask = raw_image[:,:,3] <= trans_thresh * 255
-  mod_image[trans_mask] = [255, 255, 255, 255]
+# all per-item work: crop, scale, then save or encode
+# once saved/encoded, the (uncompressed) image is released
+# in pipeline mode, only the variants' images are kept when scales are given
+def _process_item(raw_image, ctr, i, error_max_px, max_vertices, out_folder, encode, do_output, trim, image_format, compression, scales):
+  item = bound_item(raw_image, ctr, i, error_max_px, max_vertices, trim)
+  item['format'] = image_format
+  with instrument.stage('scale'):
+    variants = [lod.scale_item(item, factor) for factor in scales or []]
+  if out_folder is None and len(variants) > 0:
+    item['image'] = None
+  for curr_item in [item] + variants:
+    if curr_item['image'] is None:
+      continue
+    if out_folder is not None:
+      save_item(curr_item, out_folder, do_output, compression)
+      curr_item['image'] = None
+    elif encode:
+      with instrument.stage('encode'):
+        curr_item['encoded'] = encode_image(curr_item['image'], image_format, compression)
+      instrument.count('bytes_encoded', len(curr_item['encoded']))
+      curr_item['image'] = None
+  item['variants'] = {variant['scale']: variant for variant in variants}
+  return item
 
-  # get all present contours (using Otsu's binarization)
-  gray = cv2.cvtColor(mod_image, cv2.COLOR_BGRA2GRAY)
-  thresh = cv2.threshold(gray,0,255,cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)[1]
-  contours, hierarchy = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+# finds every item in a layer, in a single pass over the image
+# returns a list of items (dicts), each with:
+  # name: item name, used for output files
+  # image: cropped (and un-rotated) item image
+    # None once saved to out_folder, or encoded
+  # format: image format of the item (see encode_image)
+  # encoded: encoded image (only if encode)
+  # metadata: original translation, orientation & dimensions of the item
+  # colliders: simplified item outlines, in cropped image coordinates
+    # only computed (otherwise None) if error_max_px is given; max_vertices is a budget for each item
+  # variants: downscaled variants of the item (see lod.scale_item), by factor, for each of scales
+    # in pipeline mode, the item's own image isn't kept (or encoded), only its variants'
+# per-item work (including scaling) runs on threads, if threads > 1
+# tile_bytes bounds the memory used to binarize the layer (see segment.threshold)
+# trim: see bound_item; image_format, compression: see encode_image
+def analyze(raw_image, trans_thresh=TRANS_THRESH, error_max_px=None, do_output=False, threads=1, out_folder=None, encode=False, tile_bytes=None, max_vertices=None, trim=False, image_format='png', compression=None, scales=None):
+  # get all present contours
+  with instrument.stage('threshold'):
+    thresh = threshold(raw_image, trans_thresh, tile_bytes)
+  with instrument.stage('find_contours'):
+    contours, hierarchy = cv2.findContours(thresh, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+  instrument.count('contours', len(contours))
+  if hierarchy is None:
+    return []
 
   # get contours at the top of the hierarchy
-  item_idxs = hierarchy[0][:][:,3] == -1
-  item_ctrs = np.array(contours)[item_idxs]
+  item_ctrs = [ctr for ctr, h in zip(contours, hierarchy[0]) if h[3] == -1]
+  instrument.count('items', len(item_ctrs))
   if do_output:
     print("Found " + str(len(contours)) + ' total contours')
     print('Identified ' + str(len(item_ctrs)) + ' items')
 
   # bound items
-  for i, ctr in enumerate(item_ctrs):
-      # get rotated bounding rect
-      rect = cv2.minAreaRect(ctr) #((ctrx, ctry), (width, height), rotation)
-      corners = cv2.boxPoints(rect)
-      box = np.int0(corners)
-      width = int(rect[1][0])
-      height = int(rect[1][1])
-
-      # warp rect into new image; good solution comes from
-      # https://jdhao.github.io/2019/02/23/crop_rotated_rectangle_opencv/
-      src_pts = box.astype("float32")
-      dst_pts = np.array([[0, height-1],
-                          [0, 0],
-                          [width-1, 0],
-                          [width-1, height-1]], dtype="float32")
-      T = cv2.getPerspectiveTransform(src_pts, dst_pts) # transformation matrix
-      warped = cv2.warpPerspective(raw_image, T, (width, height))
-
-      # save image
-      outfile = os.path.join(out_folder,'item_' + str(i) + '.png')
-      try:
-        cv2.imwrite(outfile, warped)
-      except:
-        raise Exception("Failed to write to " + outfile + ".")
-
-      # construct and save metadata
-      outmeta = os.path.join(out_folder, 'item_' + str(i) + '.yaml')
-      metadata = {'center':{'x':rect[0][0], 'y':rect[0][1]},
-                  'rotation':rect[2],
-                  'dimensions':{'width':width, 'height':height}
-                 }
-      with open(outmeta, 'w') as outyaml:
-        yaml.dump(metadata, outyaml)
+  arg_lists = ((raw_image, ctr, i, error_max_px, max_vertices, out_folder, encode, do_output, trim, image_format, compression, scales) for i, ctr in enumerate(item_ctrs))
+  return list(_map_bounded(_process_item, arg_lists, threads))
+
+# subdivides a layer file, saving each item's image to out_folder, with a manifest
+# of every item (see manifest.write)
+# if out_folder is None, nothing is written (pipeline mode); items are only returned
+# variants at scales are saved as <name>@<factor> (see lod.variant_name), beside each item
+# records are attributed to in_file (see instrument.layer)
+def subdivide(in_file, out_folder=None, do_output=False, error_max_px=None, threads=1, encode=False, tile_bytes=None, max_vertices=None, trim=False, image_format='png', compression=None, scales=None):
+  with instrument.layer(in_file), instrument.stage('subdivide'):
+    # open file
+    try:
+      with instrument.stage('imread'):
+        raw_image = cv2.imread(in_file, cv2.IMREAD_UNCHANGED)
+      instrument.count('bytes_read', os.path.getsize(in_file))
       if do_output:
-        print('Saved item_' + str(i) + '.png, item_' + str(i) + '.yaml to ' + out_folder)
+        print('Opened ' + in_file)
+    except:
+      raise Exception('Failed to read ' + str(in_file) +'. Does it exist?')
+    if out_folder is not None and not os.path.isdir(out_folder):
+          raise Exception("Output folder " + out_folder + " does not exist.")
+
+    items = analyze(raw_image, error_max_px=error_max_px, do_output=do_output, threads=threads, out_folder=out_folder, encode=encode, tile_bytes=tile_bytes, max_vertices=max_vertices, trim=trim, image_format=image_format, compression=compression, scales=scales)
+    if out_folder is not None:
+      with instrument.stage('manifest'):
+        manifest_path = manifest.write(out_folder, items, in_file, scales)
+      instrument.count('bytes_written', os.path.getsize(manifest_path))
+    return items
 
 # define script behavior
-if __name__ == "__main__":
+# command line interface; subdivides a layer (argv defaults to the command line)
+def main(argv=None):
   parser = argparse.ArgumentParser(description='Trims images into independent items, and saves them as separate files.')
   parser.add_argument('filename', metavar='filename', type=str, help='image to subdivide')
   parser.add_argument('folder', metavar='folder', type=str, help='destination folder for result images')
   parser.add_argument('-o', '--output', default=False, action='store_true', help='include output logging')
-  args = parser.parse_args()
-  subdivide(args.filename, args.folder, args.output)
+  parser.add_argument('-t', '--threads', default=1, type=int, help='number of items to crop and save in parallel')
+  parser.add_argument('--tile-mb', default=None, type=int, help='process the layer in strips, using at most this much memory (in MB) per strip')
+  parser.add_argument('-e', '--collider-error', default=None, type=float, help='also find item colliders (saved in the manifest), with this maximum error (in px)')
+  parser.add_argument('-f', '--format', default='png', choices=IMAGE_FORMATS, help='image format of items')
+  parser.add_argument('--compression', default=None, type=int, choices=range(10), metavar='0-9', help='PNG compression level (0 is fastest, 9 is smallest)')
+  parser.add_argument('--trim', default=False, action='store_true', help='trim fully transparent margins from items')
+  parser.add_argument('-s', '--scales', default=None, type=float, nargs='*', metavar='<factor>', help='also save variants of items, downscaled by these factors (e.g. 0.5)')
+  args = parser.parse_args(argv)
+  tile_bytes = None if args.tile_mb is None else args.tile_mb * 1024**2
+  subdivide(args.filename, args.folder, args.output, error_max_px=args.collider_error, threads=args.threads, tile_bytes=tile_bytes, trim=args.trim, image_format=args.format, compression=args.compression, scales=args.scales)
+
+if __name__ == "__main__":
+  main()